@@ -0,0 +1,255 @@
+# -*- coding: UTF-8 -*-
+# @Create   : 2026/10/18 18:20
+# @Author   : yh
+# @Remark   : 基于asyncio的dubbo客户端
+
+import asyncio
+import logging
+from struct import pack, unpack_from
+
+from mxsoftpy.exception import RPCConnError
+
+from .client import DubboClient
+from .constants import CONN_MAX, CONN_TIME_OUT, HEAD_LENGTH, CLI_HEARTBEAT_REQ_HEAD, CLI_HEARTBEAT_RES_HEAD, \
+    CLI_HEARTBEAT_TAIL
+from .util import get_invoke_id
+
+dubbo_logger = logging.getLogger('dubbo')
+
+
+class DubboProtocol(asyncio.Protocol):
+    """
+    dubbo协议的asyncio实现，一个连接上可以同时进行任意数量的调用
+    按照头部中的长度从接收到的数据中切分出完整的响应，根据调用ID交给等待的Future，服务端发送的心跳请求直接回复
+    """
+
+    def __init__(self):
+        self.__transport = None
+        self.__buffer = bytearray()  # 还没有组成完整响应的数据
+        self.__pending = {}  # 调用ID -> 等待响应的Future
+        self.__error = None  # 连接关闭的原因，不为None时连接不再可用
+        self.__paused = False  # 写缓冲区超过上限时暂停写入
+        self.__drain_waiters = []  # 等待恢复写入的Future
+
+    def connection_made(self, transport):
+        self.__transport = transport
+
+    def data_received(self, data):
+        buffer = self.__buffer
+        buffer += data
+        length = len(buffer)
+        offset = 0
+        while length - offset >= HEAD_LENGTH:
+            if buffer[offset] != 0xda or buffer[offset + 1] != 0xbb:
+                # 之后的数据都无法正确切分，只能关闭连接
+                self.__close(IOError('响应头错误: %s' % str(buffer[offset:offset + HEAD_LENGTH])))
+                return
+            invoke_id, body_length = unpack_from('!qi', buffer, offset + 4)
+            end = offset + HEAD_LENGTH + body_length
+            if end > length:  # 响应体还没有全部到达
+                break
+            head = buffer[offset:offset + HEAD_LENGTH]
+            body = buffer[offset + HEAD_LENGTH:end]
+            offset = end
+            if head[2] & 0xa0 == 0xa0:  # 服务端发送的心跳请求，使用相同的调用ID回复
+                self.__transport.write(bytes(CLI_HEARTBEAT_RES_HEAD) + head[4:12] + bytes(CLI_HEARTBEAT_TAIL))
+                continue
+            future = self.__pending.pop(invoke_id, None)
+            if future is not None and not future.done():
+                future.set_result((head, body))
+        if offset:
+            del buffer[:offset]
+
+    def connection_lost(self, exc):
+        self.__close(exc)
+
+    def pause_writing(self):
+        self.__paused = True
+
+    def resume_writing(self):
+        self.__paused = False
+        self.__wake_drain_waiters()
+
+    async def send(self, invoke_id, segments):
+        """
+        发送请求并等待对应的响应
+        :param invoke_id: 请求的调用ID，即Request.invoke_id
+        :param segments: 编码后的请求，见Request.encode_segments
+        :return: (响应头, 响应体)，连接关闭时抛出IOError
+        """
+        if self.__error is not None:
+            raise self.__error
+        future = asyncio.get_running_loop().create_future()
+        self.__pending[invoke_id] = future
+        try:
+            self.__transport.writelines(segments)
+            if self.__paused:
+                await self.__drain()
+            return await future
+        finally:
+            # 调用超时或者被取消时，之后到达的响应直接丢弃
+            self.__pending.pop(invoke_id, None)
+
+    async def ping(self, time_out):
+        """
+        发送心跳请求并等待心跳响应
+        :param time_out: 等待的最大时间，单位：秒
+        """
+        invoke_id = get_invoke_id()
+        request = bytes(CLI_HEARTBEAT_REQ_HEAD) + pack('!q', invoke_id) + bytes(CLI_HEARTBEAT_TAIL)
+        await asyncio.wait_for(self.send(invoke_id, [request]), time_out)
+
+    def pending(self) -> int:
+        """
+        正在等待响应的请求数量
+        :return:
+        """
+        return len(self.__pending)
+
+    def closed(self) -> bool:
+        return self.__error is not None
+
+    def close(self) -> None:
+        if self.__transport is not None:
+            self.__transport.close()
+
+    async def __drain(self):
+        """
+        等待写缓冲区中的数据发送出去
+        """
+        waiter = asyncio.get_running_loop().create_future()
+        self.__drain_waiters.append(waiter)
+        await waiter
+
+    def __wake_drain_waiters(self, error=None):
+        waiters, self.__drain_waiters = self.__drain_waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                if error is None:
+                    waiter.set_result(None)
+                else:
+                    waiter.set_exception(error)
+
+    def __close(self, error=None):
+        """
+        关闭连接，所有等待中的请求都以IOError结束
+        :param error: 关闭的原因
+        """
+        if self.__error is not None:
+            return
+        if isinstance(error, IOError):
+            self.__error = error
+        else:
+            self.__error = IOError('dubbo连接已关闭' if error is None else 'dubbo连接已关闭: %s' % error)
+        pending, self.__pending = self.__pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(self.__error)
+        self.__wake_drain_waiters(self.__error)
+        self.__buffer = bytearray()
+        self.close()
+
+
+class AsyncDubboClient(DubboClient):
+    """
+    基于asyncio的dubbo客户端，call为协程
+    每个host使用一个DubboProtocol连接，所有调用在事件循环中并发地收发，不需要线程
+    响应体在事件循环中解析，返回值很大时会短暂阻塞事件循环，可以配合lazy、fields减少解析的内容
+    """
+
+    def __init__(self, interface, nacos_register=None, version='1.0.0', dubbo_version='2.7.6', host=None, group=None,
+                 **options):
+        """
+        参数见DubboClient，连接总是多路复用的
+        :param options: 解码选项object_mode、array_mode、table_mode、date_mode、time_zone
+        """
+        super(AsyncDubboClient, self).__init__(interface, nacos_register, version, dubbo_version, host, group,
+                                               **options)
+        self.__interface = interface
+        self.__version = version
+        self.__nc_register = nacos_register
+        self.__host = host
+        self.__protocols = {}  # host -> DubboProtocol
+        self.__locks = {}  # host -> 创建连接时使用的asyncio.Lock，避免同时创建多个连接
+
+    async def call(self, method, args=(), timeout=CONN_TIME_OUT, lazy=False, fields=None):
+        """
+        执行远程调用
+        :param method: 远程调用的方法名
+        :param args: 方法参数，见DubboClient.call
+        :param timeout: 创建连接、发送请求并等待响应的最大时间，包括重试，单位：秒，默认为10秒
+        :param lazy: 延迟解析，见DubboClient.call
+        :param fields: 只解码返回值中的这些字段，见DubboClient.call
+        """
+        if self.__nc_register:
+            host = await self.__nc_register.get_provider_host_async(self.__interface, self.__version)
+        else:
+            host = self.__host
+
+        request, segments = self._make_request(method, args)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout  # 创建连接、重试都计入同一个超时时间
+        conn_retry_max = CONN_MAX  # conn错误连接最大次数
+        while conn_retry_max > 0:
+            try:
+                protocol = await asyncio.wait_for(self._get_protocol(host), max(deadline - loop.time(), 0))
+                head, body = await asyncio.wait_for(protocol.send(request.invoke_id, segments),
+                                                    max(deadline - loop.time(), 0))
+                break
+            except asyncio.TimeoutError:
+                raise RPCConnError('RPC调用超时')
+            except IOError as e:  # 连接失败或者已经关闭，下次获取时重新创建
+                dubbo_logger.error('socket错误，%s，次数：%s' % (str(e), conn_retry_max))
+                conn_retry_max -= 1
+                if loop.time() >= deadline:
+                    raise RPCConnError('RPC调用超时')
+        else:
+            dubbo_logger.error('socket错误次数达到最大值')
+            raise RPCConnError('RPC连接socket错误')
+
+        heartbeat, _ = self._parse_head(head)
+        return self._parse_response(self._decode_body(heartbeat, body, lazy or fields is not None), fields)
+
+    async def ping(self, time_out=CONN_TIME_OUT):
+        """
+        对所有已经建立的连接发送心跳，失败的连接被关闭，下次使用时重新创建
+        :param time_out: 等待心跳响应的最大时间，单位：秒
+        """
+        for host, protocol in list(self.__protocols.items()):
+            if protocol.closed():
+                continue
+            try:
+                await protocol.ping(time_out)
+            except (IOError, asyncio.TimeoutError) as e:
+                dubbo_logger.debug('dubbo连接心跳失败：host: %s，%s' % (host, e))
+                protocol.close()
+
+    async def close(self):
+        """
+        关闭所有连接
+        """
+        protocols, self.__protocols = self.__protocols, {}
+        for protocol in protocols.values():
+            protocol.close()
+
+    async def _get_protocol(self, host):
+        """
+        获取host对应的连接，不存在或者已经关闭时创建
+        :param host: 远程主机地址
+        :return: DubboProtocol
+        """
+        protocol = self.__protocols.get(host)
+        if protocol is not None and not protocol.closed():
+            return protocol
+        lock = self.__locks.get(host)
+        if lock is None:
+            lock = self.__locks[host] = asyncio.Lock()
+        async with lock:
+            protocol = self.__protocols.get(host)
+            if protocol is None or protocol.closed():
+                ip, port = host.split(':')
+                loop = asyncio.get_running_loop()
+                _, protocol = await asyncio.wait_for(loop.create_connection(DubboProtocol, ip, int(port)),
+                                                     CONN_TIME_OUT)
+                self.__protocols[host] = protocol
+        return protocol
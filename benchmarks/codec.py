@@ -0,0 +1,318 @@
+# -*- coding: UTF-8 -*-
+# @Create   : 2026/10/18 16:40
+# @Author   : yh
+# @Remark   : 编解码器的性能测试
+
+"""
+使用固定种子生成的Hessian数据集，测试Request.encode与Response.read_next的吞吐量与内存分配，
+结果以JSON输出，保存下来之后可以与其他提交的结果对比
+在包的上级目录执行：
+python -m <包名>.benchmarks.codec -o before.json
+python -m <包名>.benchmarks.codec -o after.json --compare before.json
+"""
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+from array import array
+from datetime import datetime, timedelta, timezone
+from os.path import dirname
+
+from ..codec.decoder import Response
+from ..codec.encoder import JavaObject, Request
+
+SEED = 20261018
+# 两次结果对比时，耗时变化超过此比例才标记为变快或者变慢
+THRESHOLD = 0.05
+
+
+def make_small_rpc(rand):
+    """
+    常见的小请求：一个只有几个简单字段的字典
+    :param rand:
+    :return:
+    """
+    return {
+        'id': rand.randint(1, 1 << 20),
+        'name': 'user-%d' % rand.randint(0, 9999),
+        'enabled': True,
+        'score': round(rand.random() * 100, 2),
+        'tags': ['a', 'b', 'c'],
+    }
+
+
+def make_large_string(rand):
+    """
+    1MB左右的字符串，混入部分中文字符
+    :param rand:
+    :return:
+    """
+    words = ['benchmark', 'hessian', 'dubbo', '性能测试', 'payload', '序列化']
+    return ' '.join(rand.choice(words) for _ in range(128 * 1024))[:1024 * 1024]
+
+
+def make_deep_map(rand, depth=32, width=4):
+    """
+    多层嵌套的字典，每一层有width - 1个简单值和一个下一层的字典
+    :param rand:
+    :param depth:
+    :param width:
+    :return:
+    """
+    value = {'leaf': rand.randint(0, 1000)}
+    for level in range(depth):
+        node = {'k%d' % i: rand.choice((i, 'v%d' % level, i * 0.5)) for i in range(width - 1)}
+        node['child'] = value
+        value = node
+    return value
+
+
+def make_object_list(rand, count=2000):
+    """
+    同一个类的对象组成的列表
+    :param rand:
+    :param count:
+    :return:
+    """
+    return [JavaObject('com.example.UserDTO', {
+        'id': i,
+        'name': 'user-%d' % i,
+        'email': 'user%d@example.com' % i,
+        'age': rand.randint(18, 80),
+        'balance': round(rand.uniform(0, 10000), 2),
+        'active': rand.random() < 0.5,
+    }) for i in range(count)]
+
+
+def make_int_array(rand, count=100000):
+    """
+    long[]，数值大小混合，覆盖各种紧凑编码
+    :param rand:
+    :param count:
+    :return:
+    """
+    return array('q', (rand.choice((rand.randint(-8, 15), rand.randint(-2048, 2047), rand.randint(-1 << 40, 1 << 40)))
+                       for _ in range(count)))
+
+
+def make_double_array(rand, count=100000):
+    """
+    double[]
+    :param rand:
+    :param count:
+    :return:
+    """
+    return array('d', (rand.uniform(-1e6, 1e6) for _ in range(count)))
+
+
+def make_dates(rand, count=10000):
+    """
+    带时区的datetime组成的列表，毫秒不为0，使用8字节的0x4a编码
+    :param rand:
+    :param count:
+    :return:
+    """
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    return [start + timedelta(milliseconds=rand.randint(1, 10 ** 11) | 1) for _ in range(count)]
+
+
+def make_refs(rand, count=2000):
+    """
+    大量重复引用同一批字典的列表，最后加入一个循环引用
+    :param rand:
+    :param count:
+    :return:
+    """
+    tenants = [{'id': i, 'name': 'tenant-%d' % i} for i in range(16)]
+    items = [{'id': i, 'tenant': rand.choice(tenants)} for i in range(count)]
+    items.append({'self': items})
+    return items
+
+
+# 名称 -> 生成方法，每一项使用独立的随机数生成器，增加或修改其中一项不影响其他项的数据
+CORPUS = (
+    ('small_rpc', make_small_rpc),
+    ('large_string', make_large_string),
+    ('deep_map', make_deep_map),
+    ('object_list', make_object_list),
+    ('int_array', make_int_array),
+    ('double_array', make_double_array),
+    ('dates', make_dates),
+    ('refs', make_refs),
+)
+
+
+def make_request(value):
+    """
+    把值作为唯一的参数构造请求
+    :param value:
+    :return:
+    """
+    return Request({
+        'dubbo_version': '2.7.6',
+        'version': '1.0.0',
+        'path': 'org.apache.dubbo.Benchmark',
+        'method': 'echo',
+        'arguments': [value],
+        'group': None
+    })
+
+
+def encode_value(value):
+    """
+    得到值本身的编码结果：从完整的请求中去掉前缀和后缀，即服务端返回同样的值时响应体中的内容
+    :param value:
+    :return:
+    """
+    request = make_request(value)
+    prefix, suffix = request.compile()
+    return bytes(request.encode()[len(prefix):-len(suffix)])
+
+
+def bench(func, min_time):
+    """
+    自动调整执行次数，保证每一轮至少运行min_time秒，取3轮中最快的一轮
+    :param func:
+    :param min_time:
+    :return: 单次执行的耗时，单位：秒
+    """
+    number, total = 1, 0.0
+    while total < min_time:
+        total = min(timeit.repeat(func, number=number, repeat=3))
+        if total < min_time:
+            number *= 10 if total < min_time / 10 else 2
+    return total / number
+
+
+def measure_memory(func):
+    """
+    使用tracemalloc统计一次执行过程中的内存分配
+    :param func:
+    :return: (峰值字节数, 结果保留的内存块数, 结果保留的字节数)
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        result = func()
+        peak = tracemalloc.get_traced_memory()[1] - base
+        diff = tracemalloc.take_snapshot().compare_to(before, 'filename')
+        del result
+    finally:
+        tracemalloc.stop()
+    return peak, sum(stat.count_diff for stat in diff), sum(stat.size_diff for stat in diff)
+
+
+def run_case(name, value, min_time):
+    """
+    测试一项数据的编码与解码
+    :param name:
+    :param value:
+    :param min_time:
+    :return:
+    """
+    data = encode_value(value)
+
+    def encode():
+        return make_request(value).encode()
+
+    def decode():
+        return Response(data).read_next()
+
+    size = len(encode())
+    result = {'case': name, 'bytes': len(data), 'request_bytes': size}
+    for op, func, length in (('encode', encode, size), ('decode', decode, len(data))):
+        seconds = bench(func, min_time)
+        peak, blocks, retained = measure_memory(func)
+        result[op] = {
+            'seconds': seconds,
+            'ops_per_s': 1 / seconds,
+            'mb_per_s': length / seconds / 1e6,
+            'peak_bytes': peak,
+            'alloc_blocks': blocks,
+            'alloc_bytes': retained,
+        }
+    return result
+
+
+def get_revision():
+    """
+    获取当前代码的git提交，不在git仓库中时返回None
+    :return:
+    """
+    try:
+        output = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=dirname(dirname(__file__)),
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return output.stdout.decode().strip() or None
+
+
+def compare(results, baseline):
+    """
+    与之前保存的结果对比，按照耗时的比值输出
+    :param results:
+    :param baseline:
+    :return:
+    """
+    old_cases = {case['case']: case for case in baseline['cases']}
+    print('%-14s %-6s %12s %12s %8s' % ('case', 'op', 'before(ms)', 'after(ms)', 'ratio'), file=sys.stderr)
+    for case in results['cases']:
+        old = old_cases.get(case['case'])
+        if old is None:
+            continue
+        for op in ('encode', 'decode'):
+            before, after = old[op]['seconds'], case[op]['seconds']
+            ratio = after / before
+            mark = 'slower' if ratio > 1 + THRESHOLD else 'faster' if ratio < 1 - THRESHOLD else ''
+            line = '%-14s %-6s %12.3f %12.3f %7.2fx %s' % (case['case'], op, before * 1e3, after * 1e3, ratio, mark)
+            print(line.rstrip(), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hessian codec benchmarks')
+    parser.add_argument('-o', '--output', help='write JSON results to this file instead of stdout')
+    parser.add_argument('-c', '--case', action='append', help='only run the given case, can be repeated')
+    parser.add_argument('--compare', help='JSON results of a previous run to compare with')
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimum seconds per timing round')
+    args = parser.parse_args()
+
+    cases = []
+    for name, factory in CORPUS:
+        if args.case and name not in args.case:
+            continue
+        value = factory(random.Random('%s-%d' % (name, SEED)))
+        cases.append(run_case(name, value, args.min_time))
+        print('%-14s encode %10.1f ops/s %8.1f MB/s   decode %10.1f ops/s %8.1f MB/s' % (
+            name, cases[-1]['encode']['ops_per_s'], cases[-1]['encode']['mb_per_s'],
+            cases[-1]['decode']['ops_per_s'], cases[-1]['decode']['mb_per_s']), file=sys.stderr)
+
+    results = {
+        'seed': SEED,
+        'revision': get_revision(),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'cases': cases,
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
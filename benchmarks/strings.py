@@ -0,0 +1,177 @@
+# -*- coding: UTF-8 -*-
+# @Create   : 2026/10/18 10:12
+# @Author   : yh
+# @Remark   : 字符串编解码的性能测试
+
+"""
+对比逐字符编解码（旧实现）与整体utf-8编解码在不同长度字符串上的耗时
+在包的上级目录执行：python -m <包名>.benchmarks.strings
+"""
+
+import timeit
+from struct import unpack
+
+from ..codec.decoder import Response
+from ..codec.encoder import Request
+
+SIZES = (('1KB', 1024), ('64KB', 64 * 1024), ('4MB', 4 * 1024 * 1024))
+
+
+def legacy_encode_str(value):
+    """
+    旧的逐字符实现，仅用于对比
+    :param value:
+    :return:
+    """
+    result = []
+    length = len(value)
+    if length <= 0x1f:
+        result.append(0x00 + length)
+    elif length <= 0x3ff:
+        result.append(0x30 + (length >> 8))
+        result.append(length)
+    else:
+        result.append(ord('S'))
+        result.append(length >> 8)
+        result.append(length)
+    for v in value:
+        ch = ord(v)
+        if ch < 0x80:
+            result.append(ch & 0xff)
+        elif ch < 0x800:
+            result.append((0xc0 + ((ch >> 6) & 0x1f)) & 0xff)
+            result.append((0x80 + (ch & 0x3f)) & 0xff)
+        else:
+            result.append((0xe0 + ((ch >> 12) & 0xf)) & 0xff)
+            result.append((0x80 + ((ch >> 6) & 0x3f)) & 0xff)
+            result.append((0x80 + (ch & 0x3f)) & 0xff)
+    for i in range(len(result)):
+        result[i] = result[i] & 0xff
+    return bytearray(result)
+
+
+def legacy_decode_str(data):
+    """
+    旧的逐字符解码实现，仅用于对比，在原来的基础上修复了'R'分块的判断以便能够解码相同的数据
+    :param data:
+    :return:
+    """
+    index = 0
+
+    def read_utf(length):
+        nonlocal index
+        value = ''
+        for i in range(length):
+            ch = data[index]
+            index += 1
+            if ch < 0x80:
+                value += chr(ch)
+            elif (ch & 0xe0) == 0xc0:
+                ch1 = data[index]
+                index += 1
+                value += chr(((ch & 0x1f) << 6) + (ch1 & 0x3f))
+            else:
+                ch1, ch2 = data[index], data[index + 1]
+                index += 2
+                value += chr(((ch & 0x0f) << 12) + ((ch1 & 0x3f) << 6) + (ch2 & 0x3f))
+        return value.encode('utf-8')
+
+    value = data[index]
+    index += 1
+    string = ''
+    while value == 0x52:
+        length = unpack('!H', data[index:index + 2])[0]
+        index += 2
+        string += read_utf(length).decode('utf-8')
+        value = data[index]
+        index += 1
+    if value == ord('S'):
+        length = unpack('!H', data[index:index + 2])[0]
+        index += 2
+    elif value <= 0x1f:
+        length = value
+    else:
+        length = (value - 0x30) << 8 | data[index]
+        index += 1
+    return string + read_utf(length).decode('utf-8')
+
+
+def decode_str(data):
+    """
+    当前实现
+    :param data:
+    :return:
+    """
+    return Response(data).read_next()
+
+
+def encode_str(value):
+    """
+    当前实现：把字符串作为唯一的参数编码为完整的请求
+    :param value:
+    :return:
+    """
+    return make_request(value).encode()
+
+
+def make_request(value):
+    """
+    把字符串作为唯一的参数构造请求
+    :param value:
+    :return:
+    """
+    return Request({
+        'dubbo_version': '2.7.6',
+        'version': '1.0.0',
+        'path': 'org.apache.dubbo.Benchmark',
+        'method': 'echo',
+        'arguments': [value],
+        'group': None
+    })
+
+
+def make_payload(size, ascii_only=True):
+    """
+    生成指定字节数的字符串，非ASCII的字符串中混入中文字符
+    :param size:
+    :param ascii_only:
+    :return:
+    """
+    unit = '{"id": 1024, "name": "benchmark"}, ' if ascii_only else '{"id": 1024, "name": "性能测试"}, '
+    return (unit * (size // len(unit.encode('utf-8')) + 1))[:size]
+
+
+def bench(func, value):
+    number, total = 1, 0.0
+    # 自动调整执行次数，保证每一项至少运行0.2秒
+    while total < 0.2:
+        total = min(timeit.repeat(lambda: func(value), number=number, repeat=3))
+        if total < 0.2:
+            number *= 10 if total < 0.02 else 2
+    return total / number
+
+
+def main():
+    print('%-6s %-6s %-6s %14s %14s %9s' % ('op', 'size', 'text', 'legacy(ms)', 'current(ms)', 'speedup'))
+    for name, size in SIZES:
+        for ascii_only in (True, False):
+            value = make_payload(size, ascii_only)
+            text = 'ascii' if ascii_only else 'mixed'
+            legacy = bench(legacy_encode_str, value)
+            current = bench(encode_str, value)
+            print('%-6s %-6s %-6s %14.3f %14.3f %8.1fx' % ('encode', name, text, legacy * 1e3, current * 1e3,
+                                                            legacy / current))
+
+            # 从完整的请求中去掉前缀和后缀，得到字符串参数的编码结果
+            request = make_request(value)
+            prefix, suffix = request.compile()
+            data = bytearray(request.encode()[len(prefix):-len(suffix)])
+            assert legacy_decode_str(data) == decode_str(data) == value
+            legacy = bench(legacy_decode_str, data)
+            current = bench(decode_str, data)
+            print('%-6s %-6s %-6s %14.3f %14.3f %8.1fx' % ('decode', name, text, legacy * 1e3, current * 1e3,
+                                                            legacy / current))
+
+
+if __name__ == '__main__':
+    main()
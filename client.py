@@ -2,17 +2,20 @@
 # @Create   : 2022/7/5 16:09
 # @Author   : yh
 # @Remark   :
+import asyncio
 import random
 import logging
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from struct import unpack
 
 from nacos import NacosClient
 from mxsoftpy.exception import DataError, RPCConnError
 
-from .codec.decoder import parse_response_head, Response
+from .codec.decoder import parse_response_head, IncrementalResponse, LazyResponse
 from .codec.encoder import Request
-from .conn import conn_pool
-from .constants import DEFAULT_READ_PARAMS, CONN_MAX, CONN_TIME_OUT
+from .conn import conn_pool, mux_pool
+from .constants import CONN_MAX, CONN_TIME_OUT, HEAD_LENGTH, RECV_BUFFER_SIZE
 
 providers_host_dict = {}  # 存放providers对应host的字典
 dubbo_logger = logging.getLogger('dubbo')
@@ -49,6 +52,18 @@ class NacosRegister(object):
             self._get_providers_from_nacos(interface, version)
         return self._routing_with_wight(interface)
 
+    async def get_provider_host_async(self, interface, version):
+        """
+        get_provider_host的协程版本，第一次查询某个接口时在线程池中访问nacos，不阻塞事件循环
+        :param interface: 接口名称
+        :param version: 版本
+        :return:
+        """
+        if interface not in providers_host_dict:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._get_providers_from_nacos, interface, version)
+        return self._routing_with_wight(interface)
+
     def _get_providers_from_nacos(self, interface, version):
         """
         从nacos中根据interface获取到providers信息，并存入self.hosts
@@ -82,7 +97,8 @@ class DubboClient(object):
     """
 
     def __init__(self, interface, nacos_register: NacosRegister = None, version='1.0.0', dubbo_version='2.7.6',
-                 host=None, group=None):
+                 host=None, group=None, object_mode='dict',
+                 array_mode='list', table_mode='rows', date_mode='string', time_zone=None, multiplex=False):
         """
         :param interface: 接口名，
         :param version: 接口的版本号
@@ -90,6 +106,26 @@ class DubboClient(object):
         :param nacos_register
         :param host: 远程主机地址，用于直连，例如：172.21.4.98:20882，但是传入nacos_register时会优先从nacos_register获取
         :param group: 服务名称所具有的分组
+        :param object_mode: 返回值中Java对象的解码方式
+                            dict: 解码为dict
+                            slots: 解码为按照类路径和字段名生成的类的实例（DecodedObject的子类），可以通过属性或者下标访问字段，
+                                   字段保存在__slots__中，返回大量对象时占用的内存更少
+        :param array_mode: 返回值中基本类型数组（short[]、int[]、long[]、float[]、double[]）的解码方式
+                           list: 解码为list
+                           array: 解码为array.array，连续的定长元素整块解码，返回大量数据时更快、占用的内存更少
+                           numpy: 解码为numpy数组，需要安装numpy
+        :param table_mode: 返回值中元素全部为同一个Java类的对象的列表（例如List<RowDTO>）的解码方式
+                           rows: 解码为每一行一个对象的list
+                           columns: 按列解码为ObjectColumns（{字段名: list}），不创建每一行的对象
+                           arrays: 同columns，全部为int或者全部为float的列解码为array.array
+                           pandas: 解码为pandas.DataFrame，需要安装pandas
+        :param date_mode: 返回值中日期（java.util.Date）的解码方式
+                          string: 解码为字符串，例如：2022-07-05T16:09:00.000000+0800
+                          datetime: 解码为带时区的datetime
+                          millis: 解码为毫秒时间戳，速度最快
+        :param time_zone: date_mode为string、datetime时使用的时区(tzinfo)，默认为本地时区
+        :param multiplex: 使用多路复用的连接，多个线程的调用共享同一个连接并发进行，按照调用ID对应响应，
+                          同一个host上的并发调用数量不再受CONN_MAX的限制；响应体接收完整后才开始解析
         """
 
         self.__interface = interface
@@ -98,8 +134,13 @@ class DubboClient(object):
         self.__nc_register = nacos_register
         self.__host = host
         self.__group = group
+        self.__multiplex = multiplex
+        self.__decode_options = {'object_mode': object_mode, 'array_mode': array_mode, 'table_mode': table_mode,
+                                 'date_mode': date_mode, 'time_zone': time_zone}
+        # 请求中与参数值无关部分的编码缓存，key为(interface, version, group, method, 参数类型)
+        self.__compiled_requests = {}
 
-    def call(self, method, args=(), time_out=CONN_TIME_OUT):
+    def call(self, method, args=(), time_out=CONN_TIME_OUT, lazy=False, fields=None):
         """
         执行远程调用
         :param method: 远程调用的方法名
@@ -115,60 +156,172 @@ class DubboClient(object):
                         * double
                         * java.lang.String
                         * java.lang.Object
+                        * int[]/long[]/float[]/double[]/boolean[]（array.array或一维的numpy数组）
+                        * byte[]（bytes、bytearray、memoryview，较大的数据发送时不会被复制）
         :param time_out: 最大超时时间，单位：秒，默认为10秒
+        :param lazy: 延迟解析，返回值中的列表、dict、对象为只读的代理对象（LazyList、LazyMap），其中的值在访问时才解析，
+                     适用于返回值很大但只会用到其中少部分内容的情况
+        :param fields: 只解码返回值中的这些字段，字段路径用'.'分隔，例如：['id', 'owner.name', 'items.price']，
+                       列表中的每个元素使用相同的字段路径，对象和dict只包含这些字段并解码为dict，
+                       其余的值只跳过，不创建Python对象，需要接收完整的响应体
         """
 
-        if not isinstance(args, (list, tuple)):
-            args = [args]
-
         if self.__nc_register:
             host = self.__nc_register.get_provider_host(self.__interface, self.__version)
         else:
             host = self.__host
 
+        request, segments = self._make_request(method, args)
+        if self.__multiplex:
+            response = self._call_multiplexed(host, request.invoke_id, segments, time_out, lazy or fields is not None)
+            return self._parse_response(response, fields)
+
         conn_retry_max = CONN_MAX  # conn错误连接最大次数
         while conn_retry_max > 0:
             conn = conn_pool.get_conn(host, time_out)
             try:
                 # 发送请求
-                conn.write(Request({
-                    'dubbo_version': self.__dubbo_version,
-                    'version': self.__version.replace(':', ''),
-                    'path': self.__interface,
-                    'method': method,
-                    'arguments': args,
-                    'group': self.__group
-                }).encode())
-
-                body_buffer = self.deal_recv_data(conn)  # 接收响应数据
+                conn.write_segments(segments)
+
+                response = self.deal_recv_data(conn, lazy or fields is not None)  # 接收并解析响应数据
                 break
-            except IOError as e:  # socket错误，重新生成
+            except IOError as e:  # socket错误，丢弃这个连接，重试时重新创建
                 dubbo_logger.error('socket错误，%s，次数：%s' % (str(e), conn_retry_max))
-                conn = conn_pool.new_conn(host)
+                conn_pool.discard_conn(host, conn)
+                conn = None
             finally:
-                conn_pool.release_conn(host, conn)
+                if conn is not None:
+                    conn_pool.release_conn(host, conn)
+                conn_retry_max -= 1
+        else:
+            dubbo_logger.error('socket错误次数达到最大值')
+            raise RPCConnError('RPC连接socket错误')
+
+        return self._parse_response(response, fields)
+
+    def _make_request(self, method, args):
+        """
+        构造请求并编码
+        :param method: 远程调用的方法名
+        :param args: 方法参数，见call
+        :return: (请求, 编码后的分段)
+        """
+        if not isinstance(args, (list, tuple)):
+            args = [args]
+
+        request = Request({
+            'dubbo_version': self.__dubbo_version,
+            'version': self.__version.replace(':', ''),
+            'path': self.__interface,
+            'method': method,
+            'arguments': args,
+            'group': self.__group
+        })
+        return request, request.encode_segments(self._get_compiled_request(request, method))
+
+    def _call_multiplexed(self, host, invoke_id, segments, time_out, lazy=False):
+        """
+        通过多路复用的连接发送请求并等待对应的响应
+        :param host: 远程主机地址
+        :param invoke_id: 请求的调用ID
+        :param segments: 编码后的请求
+        :param time_out: 发送请求并等待响应的最大时间，单位：秒
+        :param lazy: 延迟解析
+        :return: 解析后的响应
+        """
+        deadline = time.monotonic() + time_out
+        conn_retry_max = CONN_MAX  # conn错误连接最大次数
+        while conn_retry_max > 0:
+            conn = mux_pool.get_conn(host)
+            try:
+                future = conn.submit(invoke_id, segments, max(deadline - time.monotonic(), 0))
+                head, body = future.result(max(deadline - time.monotonic(), 0))
+                break
+            except FutureTimeoutError:
+                conn.cancel(invoke_id)
+                raise RPCConnError('RPC调用超时')
+            except IOError as e:  # 连接已经关闭，下次获取时重新创建
+                dubbo_logger.error('socket错误，%s，次数：%s' % (str(e), conn_retry_max))
                 conn_retry_max -= 1
+                if time.monotonic() >= deadline:
+                    raise RPCConnError('RPC调用超时')
         else:
             dubbo_logger.error('socket错误次数达到最大值')
             raise RPCConnError('RPC连接socket错误')
 
-        return self._parse_response(bytearray(body_buffer))
+        heartbeat, _ = self._parse_head(head)
+        return self._decode_body(heartbeat, body, lazy)
 
-    def deal_recv_data(self, conn) -> list:
+    def _decode_body(self, heartbeat, body, lazy=False):
+        """
+        解析已经完整接收的响应体
+        :param heartbeat: 见_parse_head
+        :param body: 响应体
+        :param lazy: 延迟解析
+        :return: 解析后的响应
         """
-        处理响应数据
+        if heartbeat != 0:
+            return IncrementalResponse(0)
+        if lazy:
+            return LazyResponse(body, **self.__decode_options)
+        response = IncrementalResponse(len(body), **self.__decode_options)
+        try:
+            response.feed(body)
+        except IndexError:
+            dubbo_logger.error('dubbo数据-response解析错误')
+            dubbo_logger.error(eval(str(response)).decode())
+        return response
+
+    def _get_compiled_request(self, request, method):
+        """
+        获取请求中与参数值无关部分的编码结果，第一次调用某个方法时编码并缓存
+        :param request: 请求
+        :param method: 远程调用的方法名
+        :return: (前缀, 后缀)
+        """
+        parameter_types = request.get_parameter_types()
+        key = (self.__interface, self.__version, self.__group, method, parameter_types)
+        compiled = self.__compiled_requests.get(key)
+        if compiled is None:
+            compiled = self.__compiled_requests[key] = request.compile(parameter_types)
+        return compiled
+
+    def deal_recv_data(self, conn, lazy=False):
+        """
+        处理响应数据，每接收到一段数据就进行解析，解析与后续数据的接收同时进行
+        响应头和响应体都按照头部中的长度恰好读取，不会读取到连接中下一个响应的数据
         :param conn: socket连接
-        :return: 响应数据
+        :param lazy: 延迟解析，需要接收完整的响应体
+        :return: 解析后的响应
         """
-        heartbeat, body_length = self._parse_head(conn.read(16))  # 前16为响应头，从中获取响应体长度
+        heartbeat, body_length = self._parse_head(conn.read_exact(HEAD_LENGTH))  # 前16为响应头，从中获取响应体长度
+
+        if heartbeat == 0 and lazy:
+            # 完整的响应体一次性分配，直接接收到其中
+            return LazyResponse(conn.read_exact(body_length), **self.__decode_options)
 
         if heartbeat == 0:  # 只需要正常的数据，心跳数据不做处理
-            body_buffer = []
-            while body_length > len(body_buffer):
-                body_buffer.extend(list(conn.read(DEFAULT_READ_PARAMS)))
-            return body_buffer
+            response = IncrementalResponse(body_length, **self.__decode_options)
+            error = None
+            # 接收缓冲区在整个响应中复用，每次接收后把接收到的部分传给解析
+            with memoryview(bytearray(min(body_length, RECV_BUFFER_SIZE))) as buffer:
+                while body_length > 0:
+                    length = conn.recv_into(buffer, min(body_length, len(buffer)))
+                    body_length -= length
+                    if error is None:
+                        try:
+                            response.feed(buffer[:length])
+                        except Exception as e:
+                            error = e  # 解析出错时仍然接收完剩余的数据，避免影响连接中后续的响应
+            if isinstance(error, IndexError):
+                dubbo_logger.error('dubbo数据-response解析错误')
+                dubbo_logger.error(eval(str(response)).decode())
+            elif error is not None:
+                raise error
+            return response
 
-        return []
+        conn.read_exact(body_length)  # 心跳数据的响应体同样需要读出，避免影响后续的响应
+        return IncrementalResponse(0)
 
     @staticmethod
     def _parse_head(data):
@@ -184,15 +337,20 @@ class DubboClient(object):
             return 0, unpack('!i', data[12:])[0]
 
     @staticmethod
-    def _parse_response(body):
+    def _parse_response(response, fields=None):
         """
-        对dubbo的响应数据进行解析
-        :param body: 响应数据
+        从解析后的dubbo响应中取出返回值
+        :param response: 解析后的响应，第一个值为响应的类型，第二个值为返回值
+        :param fields: 只解码返回值中的这些字段，见call
         """
-        res = Response(body)
-        res.read_int()
-        try:
-            return res.read_next()
-        except IndexError as e:
-            dubbo_logger.error('dubbo数据-response解析错误')
-            dubbo_logger.error(eval(str(res)).decode())
+        if isinstance(response, LazyResponse):
+            response.read_int()
+            if response.length() <= 0:
+                return None
+            if fields is not None:
+                return response.read_projected(fields)
+            return response.read_lazy()
+
+        values = response.values
+        if len(values) > 1:
+            return values[1]
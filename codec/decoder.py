@@ -3,15 +3,122 @@
 # @Author   : yh
 # @Remark   :
 
-from datetime import datetime
-from struct import unpack
+import keyword
+import re
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping, Sequence
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from reprlib import recursive_repr
+from struct import unpack, unpack_from, error as StructError
 
 from mxsoftpy.exception import RPCConnError
 from ..util import parse_big_integer_to_int
 from ..constants import response_status_message
 
+try:
+    import numpy
+except ImportError:  # numpy为可选依赖，没有安装时只能解码为array.array
+    numpy = None
+
+try:
+    import pandas
+except ImportError:  # pandas为可选依赖，没有安装时只能按列解码为list、array.array
+    pandas = None
+
 functions = {}
 
+_NON_ASCII = re.compile(b'[\x80-\xff]')
+# 按照CESU-8编码的代理对的前半部分
+_ENCODED_SURROGATE = re.compile(b'\xed[\xa0-\xaf]')
+# UTF-8中的后续字节
+_CONTINUATION_BYTES = bytes(range(0x80, 0xc0))
+# 4个字节的UTF-8字符的首字节，对应Java中的两个char
+_FOUR_BYTE_LEADS = bytes(range(0xf0, 0xf8))
+
+
+def _utf8_extent(data, start, length):
+    """
+    计算从start开始的length个UTF-16编码单元在UTF-8数据中的结束位置
+    ASCII字符串一次正则查找即可确定，剩余的字符较少时根据首字节逐个跳过，较多时按块统计非后续字节的数量
+    :param data: 字节数据
+    :param start: 起始位置
+    :param length: UTF-16编码单元的数量
+    :return:
+    """
+    end = start + length
+    match = _NON_ASCII.search(data, start, end)
+    if match is None:
+        if end > len(data):
+            raise IndexError('Not enough data for utf-8 string')
+        return end
+
+    position = match.start()
+    units = position - start
+    if length - units <= 64:
+        # 剩余的字符较少时直接根据每个字符的首字节跳过
+        while units < length:
+            lead = data[position]
+            if lead < 0x80:
+                position += 1
+            elif lead < 0xe0:
+                position += 2
+            elif lead < 0xf0:
+                position += 3
+            else:
+                position += 4
+                units += 1
+            units += 1
+        if position > len(data):
+            raise IndexError('Not enough data for utf-8 string')
+        return position
+
+    while units < length:
+        # 每个字节最多对应一个编码单元，所以至少还需要读取剩余数量的字节
+        end = position + length - units
+        chunk = bytes(data[position:end])
+        if len(chunk) < length - units:
+            raise IndexError('Not enough data for utf-8 string')
+        units += len(chunk.translate(None, _CONTINUATION_BYTES))
+        units += len(chunk) - len(chunk.translate(None, _FOUR_BYTE_LEADS))
+        position = end
+    # 最后一个字符可能只统计到了首字节，根据首字节补齐后续字节，不能根据后面的字节判断，下一个值的开头也可能在0x80-0xbf之间
+    last = end - 1
+    while 0x80 <= data[last] < 0xc0:
+        last -= 1
+    lead = data[last]
+    if lead >= 0xf0:
+        end = max(end, last + 4)
+    elif lead >= 0xe0:
+        end = max(end, last + 3)
+    elif lead >= 0xc0:
+        end = max(end, last + 2)
+    if end > len(data):
+        raise IndexError('Not enough data for utf-8 string')
+    return end
+
+
+_BIG_ENDIAN = sys.byteorder == 'big'
+# 单字节的整数(0x80-0xbf)与long(0xd8-0xef)：(首字节的范围, 值为0的首字节, 匹配连续多个的正则, 把首字节转换为有符号字节的表)
+_COMPACT_INTS = (0x80, 0xbf, 0x90, re.compile(b'[\x80-\xbf]+'), bytes((i - 0x90) & 0xff for i in range(256)))
+_COMPACT_LONGS = (0xd8, 0xef, 0xe0, re.compile(b'[\xd8-\xef]+'), bytes((i - 0xe0) & 0xff for i in range(256)))
+# 连续的定长元素少于此数量时直接通过struct解码
+_PACKED_RUN = 16
+# 基本类型数组对应的有类型列表 -> (array.array的typecode, 可以整块解码的定长元素的类型标记, 单字节的元素)
+# 定长元素的宽度与typecode的itemsize相同，'I'为4字节，'L'、'D'为8字节
+# float[]的元素在Java中按照double编码，解码为double避免精度损失
+_PRIMITIVE_LISTS = {
+    '[short': ('h', None, _COMPACT_INTS),
+    '[int': ('i', 0x49, _COMPACT_INTS),
+    '[long': ('q', 0x4c, _COMPACT_LONGS),
+    '[float': ('d', 0x44, None),
+    '[double': ('d', 0x44, None),
+}
+
 
 def ranges(*defined_ranges):
     """
@@ -21,7 +128,7 @@ def ranges(*defined_ranges):
     """
 
     def decorator(func):
-        # 遍历所有的范围
+        # 遍历所有的范围，方法本身不做包装，分派表中直接保存原始方法
         for defined_range in defined_ranges:
             if isinstance(defined_range, (tuple, list)):
                 if not len(defined_range) == 2:
@@ -33,13 +140,173 @@ def ranges(*defined_ranges):
                 functions[defined_range] = func
             else:
                 raise ValueError('Defined value {} illegal'.format(defined_ranges))
+        return func
 
-        def wrapper(*args, **kwargs):
-            return func(*args, **kwargs)  # 原始方法正常执行
+    return decorator
 
-        return wrapper
 
-    return decorator
+class DecodedObject(object):
+    """
+    解码Java对象时生成的类的基类，字段保存在__slots__中
+    可以通过属性或者下标访问字段，与dict比较时比较所有的字段
+    """
+    __slots__ = ()
+    _path = None  # Java类的路径
+    _fields = ()  # 按照类定义中的顺序排列的字段名
+
+    def __getitem__(self, field_name):
+        if field_name not in self._fields:
+            raise KeyError(field_name)
+        return getattr(self, field_name)
+
+    def _asdict(self):
+        """
+        转化为dict
+        :return:
+        """
+        return {field_name: getattr(self, field_name) for field_name in self._fields}
+
+    def __eq__(self, other):
+        if isinstance(other, DecodedObject):
+            return type(self) is type(other) and all(getattr(self, f) == getattr(other, f) for f in self._fields)
+        if isinstance(other, dict):
+            return self._asdict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    @recursive_repr()
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__,
+                           ', '.join('%s=%r' % (f, getattr(self, f)) for f in self._fields))
+
+
+_object_classes = {}  # (类路径, 字段名) -> 生成的类，所有的响应共用
+_object_classes_lock = threading.Lock()
+# 需要转化为Python中的数字，不生成类
+_CONVERTED_PATHS = ('java.math.BigDecimal', 'java.math.BigInteger')
+
+
+def get_object_class(path, fields):
+    """
+    获取Java类对应的生成的类，第一次获取时生成并缓存
+    字段名不能作为Python的属性名（不是合法的标识符、关键字、以双下划线开头、重复、与DecodedObject的属性重名）时返回None，
+    这时仍然解码为dict
+    :param path: Java类的路径
+    :param fields: 字段名
+    :return: DecodedObject的子类或者None
+    """
+    key = (path, tuple(fields))
+    try:
+        return _object_classes[key]
+    except KeyError:
+        pass
+
+    fields = key[1]
+    cls = None
+    if path not in _CONVERTED_PATHS and len(set(fields)) == len(fields) and all(
+            f.isidentifier() and not keyword.iskeyword(f) and not f.startswith('__') and not hasattr(DecodedObject, f)
+            for f in fields):
+        name = re.sub(r'\W', '_', path.rsplit('.', 1)[-1])
+        if not name.isidentifier():
+            name = '_' + name
+        # 生成按位置传入所有字段的构造方法，实例参数使用以双下划线开头的名称，不会与字段名（例如self）重复
+        source = 'def __init__(__self%s):\n%s' % (''.join(', ' + f for f in fields),
+                                                  ''.join('    __self.%s = %s\n' % (f, f) for f in fields) or
+                                                  '    pass\n')
+        namespace = {}
+        exec(source, namespace)
+        cls = type(name, (DecodedObject,), {
+            '__slots__': fields,
+            '__init__': namespace['__init__'],
+            '__module__': __name__,
+            '_path': path,
+            '_fields': fields
+        })
+    with _object_classes_lock:
+        return _object_classes.setdefault(key, cls)
+
+
+class ObjectColumns(dict):
+    """
+    按列解码的同一个Java类的对象列表，{字段名: 列}，字段按照类定义中的顺序排列
+    可以直接作为JavaObjectBatch的columns重新编码
+    """
+
+    def __init__(self, path, columns, length):
+        """
+        :param path: Java类的路径
+        :param columns: [(字段名, 列), ...]
+        :param length: 行数
+        """
+        super(ObjectColumns, self).__init__(columns)
+        self.path = path
+        self.length = length
+
+    def __repr__(self):
+        return 'ObjectColumns(%r, %s)' % (self.path, dict.__repr__(self))
+
+
+def _to_array(column):
+    """
+    全部为int或者全部为float的列转换为array.array，其余的列不变
+    :param column: list
+    :return:
+    """
+    types = set(map(type, column))
+    try:
+        if types == {int}:
+            return array('q', column)
+        if types == {float}:
+            return array('d', column)
+    except OverflowError:  # 超出long范围的整数
+        pass
+    return column
+
+
+# 按列解码的列表中每一行在引用列表中的占位，被引用时才转换为dict
+_TABLE_ROW = object()
+
+_timezones = {}  # UTC偏移的秒数 -> timezone，本地时区的偏移随夏令时变化，相同的偏移共用一个对象
+
+
+def _local_timezone(seconds):
+    """
+    获取某一时刻本地时区的偏移对应的timezone
+    :param seconds: 时间戳，单位：秒
+    :return:
+    """
+    offset = time.localtime(seconds).tm_gmtoff
+    try:
+        return _timezones[offset]
+    except KeyError:
+        return _timezones.setdefault(offset, timezone(timedelta(seconds=offset)))
+
+
+def _get_date_converter(date_mode, time_zone):
+    """
+    获取把毫秒时间戳转换为date_mode对应的结果的函数
+    :param date_mode: 见Response
+    :param time_zone: 见Response
+    :return: 转换函数，millis返回None，即不需要转换
+    """
+    if date_mode == 'millis':
+        return None
+    fromtimestamp = datetime.fromtimestamp
+    if time_zone is None:
+        def to_datetime(millis):
+            return fromtimestamp(millis / 1000, _local_timezone(millis // 1000))
+    else:
+        def to_datetime(millis):
+            return fromtimestamp(millis / 1000, time_zone)
+    if date_mode == 'datetime':
+        return to_datetime
+
+    def to_string(millis):
+        # isoformat的前26个字符固定为日期、时间与微秒，之后为带冒号的时区偏移，例如：+08:00，去掉冒号
+        value = to_datetime(millis).isoformat(timespec='microseconds')
+        return value[:26] + value[26:].replace(':', '')
+    return to_string
 
 
 class Response(object):
@@ -58,17 +325,62 @@ class Response(object):
     * list
     * map
     * date
+    * binary
     * null
     """
 
-    def __init__(self, data):
-        self.__data = data  # data是字节数组
+    def __init__(self, data, object_mode='dict', array_mode='list', table_mode='rows', date_mode='string',
+                 time_zone=None):
+        """
+        :param data: 响应数据
+        :param object_mode: Java对象的解码方式
+                            dict: 解码为dict
+                            slots: 解码为按照类路径和字段名生成的DecodedObject子类的实例，字段保存在__slots__中，占用的内存更少
+        :param array_mode: 基本类型数组（short[]、int[]、long[]、float[]、double[]）的解码方式
+                           list: 解码为list
+                           array: 解码为array.array，连续的定长元素整块解码，不创建每个元素的Python对象
+                           numpy: 同array，最后转换为共享内存的numpy数组，需要安装numpy
+        :param table_mode: 元素全部为同一个Java类的对象的列表（例如List<RowDTO>）的解码方式
+                           rows: 解码为每一行一个对象的list
+                           columns: 按列解码为ObjectColumns，字段值直接放入每一列中，不创建每一行的对象
+                           arrays: 同columns，全部为int或者全部为float的列转换为array.array
+                           pandas: 按列解码后创建pandas.DataFrame，类的路径保存在attrs['path']中，需要安装pandas
+                           列表中出现其他类型的元素时，已经读取的行转换为对象，整个列表仍然解码为list
+                           引用按列解码的列表中的某一行时，得到这一行的字段组成的dict
+        :param date_mode: 日期（java.util.Date）的解码方式
+                          string: 解码为字符串，例如：2022-07-05T16:09:00.000000+0800，时区偏移与time_zone一致
+                          datetime: 解码为带时区的datetime
+                          millis: 解码为毫秒时间戳(int)，不做任何转换
+        :param time_zone: date_mode为string、datetime时使用的时区(tzinfo)，默认为本地时区
+        """
+        if object_mode not in ('dict', 'slots'):
+            raise ValueError('Unknown object mode {}'.format(object_mode))
+        if array_mode not in ('list', 'array', 'numpy'):
+            raise ValueError('Unknown array mode {}'.format(array_mode))
+        if array_mode == 'numpy' and numpy is None:
+            raise ValueError('Array mode numpy requires numpy to be installed')
+        if table_mode not in ('rows', 'columns', 'arrays', 'pandas'):
+            raise ValueError('Unknown table mode {}'.format(table_mode))
+        if table_mode == 'pandas' and pandas is None:
+            raise ValueError('Table mode pandas requires pandas to be installed')
+        if date_mode not in ('string', 'datetime', 'millis'):
+            raise ValueError('Unknown date mode {}'.format(date_mode))
+        self.__data = data  # data是字节数组，逐个字节的读取直接使用原始数据
+        self.__view = memoryview(data)  # 字符串、二进制等整块的数据通过memoryview切片读取，不复制
         self.__index = 0
+        self.object_mode = object_mode
+        self.array_mode = array_mode
+        self.table_mode = table_mode
+        self.date_mode = date_mode
+        self.convert_date = _get_date_converter(date_mode, time_zone)  # 毫秒时间戳的转换函数，millis时为None
         self.types = []
         self.objects = []
         # 对于一个类来说，有path的地方就应该有field_name
         self.paths = []
         self.field_names = []
+        self.object_classes = []  # 每个类定义对应的生成的类，解码为dict时为None
+        # 按列解码的列表：[类的编号, 每一列, 每一行在引用列表中的位置, 每一列的append方法]，第一行读取前类的编号为None
+        self.tables = []
 
     def get_byte(self):
         """
@@ -105,6 +417,45 @@ class Response(object):
         self.__index += num
         return value
 
+    def tell(self):
+        """
+        当前读取的位置
+        :return:
+        """
+        return self.__index
+
+    def seek(self, index):
+        """
+        移动到指定的位置
+        :param index:
+        :return:
+        """
+        self.__index = index
+
+    def _extend(self, chunk, compact=False):
+        """
+        向缓冲区追加数据，供增量解析使用
+        返回的memoryview切片（二进制数据）还在使用时缓冲区无法原地修改，此时把未读取的部分复制到新的缓冲区
+        :param chunk: 追加的数据
+        :param compact: 是否同时丢弃已经读取的部分
+        :return:
+        """
+        data = self.__data
+        index = self.__index
+        self.__view.release()
+        try:
+            if compact and index:
+                del data[:index]
+                index = 0
+            data += chunk
+        except BufferError:
+            data = data[index:]
+            data += chunk
+            index = 0
+        self.__data = data
+        self.__view = memoryview(data)
+        self.__index = index
+
     @ranges(ord('T'), ord('F'))
     def read_boolean(self):
         """
@@ -125,21 +476,22 @@ class Response(object):
         读取一个整型数据
         :return:
         """
-        value = self.read_byte()
+        data = self.__data
+        index = self.__index
+        value = data[index]
         if 0x80 <= value <= 0xbf:
-            result = value - 0x90
+            self.__index = index + 1
+            return value - 0x90
         elif 0xc0 <= value <= 0xcf:
-            i = (value - 0xc8) << 8
-            i |= self.read_byte()
-            result = i
+            self.__index = index + 2
+            return (value - 0xc8) << 8 | data[index + 1]
         elif 0xd0 <= value <= 0xd7:
-            i = (value - 0xd4) << 16
-            i |= self.read_byte() << 8
-            i |= self.read_byte()
-            result = i
+            self.__index = index + 3
+            return (value - 0xd4) << 16 | data[index + 1] << 8 | data[index + 2]
         else:
-            result = unpack('!i', self.read_bytes(4))[0]
-        return result
+            result = unpack_from('!i', data, index + 1)[0]
+            self.__index = index + 5
+            return result
 
     @ranges((0x5b, 0x5f), ord('D'))
     def read_double(self):
@@ -147,44 +499,45 @@ class Response(object):
         读取一个浮点类型
         :return:
         """
-        value = self.read_byte()
-        if value == 0x5b:
+        data = self.__data
+        index = self.__index
+        value = data[index]
+        if value == ord('D'):
+            result = unpack_from('!d', data, index + 1)[0]
+            self.__index = index + 9
+        elif value == 0x5b:
             result = 0.0
+            self.__index = index + 1
         elif value == 0x5c:
             result = 1.0
+            self.__index = index + 1
         elif value == 0x5d:
-            result = float(unpack('!b', self.read_bytes(1))[0])
+            result = float(unpack_from('!b', data, index + 1)[0])
+            self.__index = index + 2
         elif value == 0x5e:
-            result = float(unpack('!h', self.read_bytes(2))[0])
+            result = float(unpack_from('!h', data, index + 1)[0])
+            self.__index = index + 3
         elif value == 0x5f:
-            result = float(unpack('!i', self.read_bytes(4))[0]) * 0.001
-        elif value == ord('D'):
-            result = float(unpack('!d', self.read_bytes(8))[0])
+            result = float(unpack_from('!i', data, index + 1)[0]) * 0.001
+            self.__index = index + 5
         else:
             raise RPCConnError('{0} is not a float'.format(value))
         return result
 
     def _read_utf(self, length):
         """
-        读取n个字符
+        读取n个字符（Java中的char，即UTF-16编码单元），先确定这些字符占用的字节范围，再整体解码一次
+        Java按照char逐个编码，所以BMP以外的字符是两个分别编码的代理对，解码后需要合并
         :param length:
         :return:
         """
-        value = ''
-        for i in range(length):
-            ch = self.read_byte()
-            if ch < 0x80:
-                value += chr(ch)
-            elif (ch & 0xe0) == 0xc0:
-                ch1 = self.read_byte()
-                value += chr(((ch & 0x1f) << 6) + (ch1 & 0x3f))
-            elif (ch & 0xf0) == 0xe0:
-                ch1 = self.read_byte()
-                ch2 = self.read_byte()
-                value += chr(((ch & 0x0f) << 12) + ((ch1 & 0x3f) << 6) + (ch2 & 0x3f))
-            else:
-                raise ValueError('Can\'t parse utf-8 char {}'.format(ch))
-        return value.encode('utf-8')  # 将unicode转化为str类型
+        start = self.__index
+        end = _utf8_extent(self.__data, start, length)
+        self.__index = end
+        value = str(self.__view[start:end], 'utf-8', 'surrogatepass')
+        if end - start != length and _ENCODED_SURROGATE.search(self.__data, start, end) is not None:
+            value = value.encode('utf-16', 'surrogatepass').decode('utf-16')
+        return value
 
     @ranges((0x00, 0x1f), (0x30, 0x33), 0x52, ord('S'))
     def read_string(self):
@@ -193,48 +546,117 @@ class Response(object):
         :return:
         """
         value = self.read_byte()
-        string = ''
-        while value == 'R':
-            length = unpack('!h', self.read_bytes(2))[0]
-            string += self._read_utf(length)
+        chunks = []
+        while value == 0x52:  # 'R'，非最后一个分块
+            length = unpack_from('!H', self.__data, self.__index)[0]
+            self.__index += 2
+            chunks.append(self._read_utf(length))
             value = self.read_byte()
 
         if value == ord('S'):
-            length = unpack('!h', self.read_bytes(2))[0]
+            length = unpack_from('!H', self.__data, self.__index)[0]
+            self.__index += 2
         elif 0x00 <= value <= 0x1f:
             length = value
         else:
             length = (value - 0x30) << 8 | self.read_byte()
 
-        string += self._read_utf(length).decode('utf-8')
+        string = self._read_utf(length)
+        if chunks:
+            chunks.append(string)
+            string = ''.join(chunks)
         return string
 
+    @ranges((0x20, 0x2f), (0x34, 0x37), 0x41, ord('B'))
+    def read_binary(self):
+        """
+        读取二进制数据，只有一个分块时直接返回响应数据的memoryview切片，不复制数据
+        :return: memoryview
+        """
+        value = self.read_byte()
+        chunks = []
+        while value == 0x41:  # 'A'，非最后一个分块
+            length = unpack('!H', self.read_bytes(2))[0]
+            chunks.append(self._read_view(length))
+            value = self.read_byte()
+
+        if value == ord('B'):
+            length = unpack('!H', self.read_bytes(2))[0]
+        elif 0x20 <= value <= 0x2f:
+            length = value - 0x20
+        elif 0x34 <= value <= 0x37:
+            length = (value - 0x34) << 8 | self.read_byte()
+        else:
+            raise RPCConnError('{0} is not binary'.format(value))
+
+        result = self._read_view(length)
+        if chunks:
+            chunks.append(result)
+            result = memoryview(b''.join(chunks))
+        return result
+
+    def _read_view(self, length):
+        """
+        读取n个字节，返回memoryview切片
+        :param length:
+        :return:
+        """
+        start = self.__index
+        end = start + length
+        if end > len(self.__data):
+            raise IndexError('Not enough data for binary')
+        self.__index = end
+        return self.__view[start:end]
+
     @ranges((0x60, 0x6f), ord('O'))
     def read_object(self):
         """
         读取一个对象
         :return:
         """
+        slot = len(self.objects)
+        ref = self._read_object_head()
+        read_next = self.read_next
+        cls = self.object_classes[ref]
+        if cls is not None:
+            # 先创建对象再读取字段，字段中可以引用这个对象本身
+            result = cls.__new__(cls)
+            self.objects.append(result)
+            result.__init__(*[read_next() for i in range(len(cls._fields))])
+            return result
+
         result = {}
         self.objects.append(result)
+        for field_name in self.field_names[ref]:
+            result[field_name] = read_next()
+        return self._convert_object(self.paths[ref], result, slot)
+
+    def _read_object_head(self):
+        """
+        读取对象的开头，即对象所属类的编号
+        :return:
+        """
         value = self.read_byte()
         if 0x60 <= value <= 0x6f:
-            ref = value - 0x60
-        else:
-            ref = self.read_int()
-        field_names = self.field_names[ref]
-        for field_name in field_names:
-            field_value = self.read_next()
-            result[field_name] = field_value
+            return value - 0x60
+        return self.read_int()
 
-        path = self.paths[ref]
+    def _convert_object(self, path, result, slot):
+        """
+        BigDecimal、BigInteger转化为Python中的数字，同时替换引用列表中的对象
+        :param path: 对象的类路径
+        :param result: 读取到的字段
+        :param slot: 对象在引用列表中的位置
+        :return:
+        """
         if path == 'java.math.BigDecimal':
-            result = float(result['stringCache']) or 0
-            self.objects[-1] = result
+            # hessian的BigDecimal序列化器写入字段value，按照字段反射序列化时只有stringCache
+            value = result.get('value')
+            result = float(value if value is not None else result['stringCache']) or 0
+            self.objects[slot] = result
         elif path == 'java.math.BigInteger':
             result = parse_big_integer_to_int(result)
-            self.objects[-1] = result
-
+            self.objects[slot] = result
         return result
 
     @ranges(ord('C'))
@@ -243,16 +665,24 @@ class Response(object):
         读取一个类的类属性，主要是类名和类中的变量名
         :return:
         """
+        self._read_class_definition()
+        return self.read_object()
+
+    def _read_class_definition(self):
+        """
+        读取类名和类中的变量名，读取完整后才加入到类定义的列表中
+        :return: 类名
+        """
         self.read_byte()
         path = self.read_string()
-        self.paths.append(path)
-
         field_length = self.read_int()
         field_names = []
         for i in range(field_length):
             field_names.append(self.read_string())
+        self.paths.append(path)
         self.field_names.append(field_names)
-        return self.read_object()
+        self.object_classes.append(get_object_class(path, field_names) if self.object_mode == 'slots' else None)
+        return path
 
     def read_type(self):
         """
@@ -275,36 +705,407 @@ class Response(object):
         :return:
         """
         result = []
+        slot = len(self.objects)
         self.objects.append(result)
+        _type, length = self._read_list_head()
+        if self.table_mode != 'rows' and _type not in _PRIMITIVE_LISTS:
+            return self._read_table(result, slot, length)
+        # 可变长度的列表，以'Z'结尾
+        if length is None:
+            while self.__data[self.__index] != ord('Z'):
+                result.append(self.read_next())
+            self.__index += 1
+            return result
+        if self.array_mode != 'list' and _type in _PRIMITIVE_LISTS:
+            typecode, tag, compact = _PRIMITIVE_LISTS[_type]
+            result = self.objects[slot] = array(typecode)
+            self._read_packed(result, length, tag, compact)
+            return self._wrap_array(result, slot)
+        return self._read_items(result, length)
+
+    def _read_table(self, result, slot, length):
+        """
+        按列读取列表，列表为空或者第一个元素不是对象时按照普通的列表读取
+        :param result: 存放元素的列表，已经登记在引用列表中
+        :param slot: 列表在引用列表中的位置
+        :param length: 元素数量，可变长度的列表为None
+        :return: 按列解码的结果或者list
+        """
+        table = [None, None, array('q'), None]
+        self.tables.append(table)
+        return self._read_rows(result, slot, table, length)
+
+    def _read_rows(self, result, slot, table, length):
+        """
+        继续读取按列解码的列表中剩余的元素
+        :param result: 存放元素的列表
+        :param slot: 列表在引用列表中的位置
+        :param table: 按列解码的列表，见self.tables
+        :param length: 剩余的元素数量，可变长度的列表为None
+        :return: 按列解码的结果或者list
+        """
+        data = self.__data
+        read_row = self._read_row
+        count = 0
+        while count != length:
+            if length is None and data[self.__index] == 0x5a:  # 'Z'
+                break
+            if not read_row(table):
+                # 出现其他类型的元素，剩余的部分按照普通的列表读取
+                self._untable(table, result)
+                if length is None:
+                    while data[self.__index] != 0x5a:
+                        result.append(self.read_next())
+                    self.__index += 1
+                    return result
+                return self._read_items(result, length - count)
+            count += 1
+        if length is None:
+            self.__index += 1
+        return self._finish_table(table, slot, result)
+
+    def _read_row(self, table):
+        """
+        读取列表中的一个元素作为一行，字段值直接放入每一列中，元素之前的类定义直接登记
+        :param table: 按列解码的列表，见self.tables
+        :return: 元素不是同一个类的对象时返回False，此时位置回到元素的开头
+        """
+        data = self.__data
+        while data[self.__index] == 0x43:  # 'C'
+            self._read_class_definition()
+        index = self.__index
+        value = data[index]
+        if 0x60 <= value <= 0x6f:
+            ref = value - 0x60
+            self.__index = index + 1
+        elif value == 0x4f:  # 'O'
+            self.__index = index + 1
+            ref = self.read_int()
+        else:
+            return False
+        if table[0] is None:
+            # 第一行确定列表中对象的类，需要转换为数字的类按照普通的列表读取
+            if self.paths[ref] in _CONVERTED_PATHS:
+                self.__index = index
+                return False
+            table[0] = ref
+            table[1] = [[] for _ in self.field_names[ref]]
+            table[3] = [column.append for column in table[1]]
+        elif ref != table[0]:
+            self.__index = index
+            return False
+        # 先占用这一行在引用列表中的位置，字段中的对象、列表、dict排在其后
+        objects = self.objects
+        slot = len(objects)
+        table[2].append(slot)
+        objects.append(_TABLE_ROW)
+        # 与_read_items相同，常见的值直接在循环中解码，其余的交给read_next
+        read_next = self.read_next
+        size = len(data)
+        index = self.__index
+        for append in table[3]:
+            value = data[index]
+            if 0x80 <= value <= 0xbf:
+                append(value - 0x90)
+                index += 1
+            elif value <= 0x1f and index + 1 + value <= size:
+                end = index + 1 + value
+                try:
+                    append(data[index + 1:end].decode('ascii'))
+                except UnicodeDecodeError:
+                    self.__index = index
+                    append(read_next())
+                    index = self.__index
+                else:
+                    index = end
+            elif 0xc0 <= value <= 0xcf:
+                append((value - 0xc8) << 8 | data[index + 1])
+                index += 2
+            elif 0xd0 <= value <= 0xd7:
+                append((value - 0xd4) << 16 | data[index + 1] << 8 | data[index + 2])
+                index += 3
+            elif value == 0x44:  # 'D'
+                append(unpack_from('!d', data, index + 1)[0])
+                index += 9
+            elif value == 0x4e:  # 'N'
+                append(None)
+                index += 1
+            elif value == 0x54:  # 'T'
+                append(True)
+                index += 1
+            elif value == 0x46:  # 'F'
+                append(False)
+                index += 1
+            else:
+                self.__index = index
+                append(read_next())
+                index = self.__index
+        self.__index = index
+        if objects[slot] is not _TABLE_ROW:
+            # 这一行在读取的过程中被自身的字段引用，补全当时创建的对象
+            self._table_row(table, len(table[2]) - 1, objects[slot])
+        return True
+
+    def _untable(self, table, result):
+        """
+        把已经按列读取的行转换为对象放入列表，之后不再按列读取
+        :param table: 按列解码的列表，见self.tables
+        :param result: 存放元素的列表
+        :return:
+        """
+        ref = table[0]
+        if ref is not None:
+            for row, slot in enumerate(table[2]):
+                if self.objects[slot] is _TABLE_ROW:
+                    self.objects[slot] = self._table_row(table, row)
+                result.append(self.objects[slot])
+        self.tables.remove(table)
+
+    def _table_row(self, table, row, result=None):
+        """
+        把按列解码的列表中的一行转换为对象，只加入已经读取的字段
+        :param table: 按列解码的列表，见self.tables
+        :param row: 行号
+        :param result: 需要补全字段的对象，为None时创建新的对象
+        :return:
+        """
+        ref = table[0]
+        cls = self.object_classes[ref]
+        if result is None:
+            result = {} if cls is None else cls.__new__(cls)
+        for field_name, column in zip(self.field_names[ref], table[1]):
+            if row < len(column):
+                if cls is None:
+                    result[field_name] = column[row]
+                else:
+                    setattr(result, field_name, column[row])
+        return result
+
+    def _finish_table(self, table, slot, result):
+        """
+        按列解码的列表读取完成后，按照table_mode转换为最终的结果并更新引用列表
+        :param table: 按列解码的列表，见self.tables
+        :param slot: 列表在引用列表中的位置
+        :param result: 存放元素的列表，没有读取任何行时直接返回
+        :return:
+        """
+        ref = table[0]
+        if ref is None:
+            self.tables.remove(table)
+            return result
+        field_names = self.field_names[ref]
+        columns = table[1]
+        if self.table_mode == 'arrays':
+            columns = [_to_array(column) for column in columns]
+        if self.table_mode == 'pandas':
+            output = pandas.DataFrame(dict(zip(field_names, columns)), columns=field_names)
+            output.attrs['path'] = self.paths[ref]
+            # 被引用的行从DataFrame中读取，不再保留原来的列
+            columns = [output[field_name] for field_name in field_names]
+        else:
+            output = ObjectColumns(self.paths[ref], zip(field_names, columns), len(table[2]))
+        table[1] = columns
+        table[3] = None
+        self.objects[slot] = output
+        return output
+
+    def _read_list_head(self):
+        """
+        读取列表的开头，包括类型和长度
+        :return: (列表的类型，无类型的列表为None, 列表的长度，可变长度的列表为None)
+        """
         value = self.read_byte()
         # 固定长度的有类型短小列表
         if 0x70 <= value <= 0x77:
-            _type = self.read_type()  # type对于Python来说没有用处
-            length = value - 0x70
-            for i in range(length):
-                result.append(self.read_next())
+            return self.read_type(), value - 0x70
         # 固定长度的无类型短小列表
         elif 0x78 <= value <= 0x7f:
-            length = value - 0x78
-            for i in range(length):
-                result.append(self.read_next())
+            return None, value - 0x78
         # 固定长度的有类型列表
         elif value == 0x56:
             _type = self.read_type()
-            length = self.read_int()
-            for i in range(length):
-                result.append(self.read_next())
+            return _type, self.read_int()
         # 固定长度的无类型列表
         elif value == 0x58:
-            length = self.read_int()
-            for i in range(length):
-                result.append(self.read_next())
+            return None, self.read_int()
         # 可变长度的有类型列表
         elif value == 0x55:
-            _type = self.read_type()
-        # 可变长度的无类型列表
-        elif value == 0x57:
-            pass
+            return self.read_type(), None
+        return None, None
+
+    def _read_packed(self, result, length, tag, compact, partial=False):
+        """
+        读取基本类型数组中的length个元素放入array.array
+        连续的定长元素取出类型标记之间的字节整块转换，连续的单字节整数整块查表转换，其余的元素逐个解码
+        :param result: array.array
+        :param length: 元素数量
+        :param tag: 可以整块解码的定长元素的类型标记，没有时为None
+        :param compact: 单字节的元素，见_COMPACT_INTS，没有时为None
+        :param partial: 数据可能不完整，为True时遇到数据不足则停止读取，否则抛出IndexError
+        :return: 读取的元素数量
+        """
+        data = self.__data
+        size = len(data)
+        width = result.itemsize
+        step = width + 1
+        low, high, zero, pattern, table = compact or (-1, -1, 0, None, None)
+        ints = compact is _COMPACT_INTS  # 两个、三个字节的整数直接在循环中解码
+        append = result.append
+        count = 0
+        index = self.__index
+        while count < length:
+            if index >= size:
+                if partial:
+                    break
+                raise IndexError('Not enough data')
+            value = data[index]
+            if value == tag and index + 2 * step <= size and data[index + step] == tag:
+                self.__index = index
+                count += self._read_run(result, tag, length - count)
+                index = self.__index
+            elif low <= value <= high:
+                if index + 1 < size and low <= data[index + 1] <= high:
+                    end = pattern.match(data, index, min(size, index + length - count)).end()
+                    result.extend(memoryview(data[index:end].translate(table)).cast('b'))
+                    count += end - index
+                    index = end
+                else:
+                    append(value - zero)
+                    count += 1
+                    index += 1
+            elif ints and 0xc0 <= value <= 0xd7 and index + 3 <= size:
+                if value <= 0xcf:  # 两个字节的整数
+                    append((value - 0xc8) << 8 | data[index + 1])
+                    index += 2
+                else:  # 三个字节的整数
+                    append((value - 0xd4) << 16 | data[index + 1] << 8 | data[index + 2])
+                    index += 3
+                count += 1
+            else:
+                self.__index = index
+                try:
+                    append(self.read_next())
+                except (IndexError, StructError):
+                    if not partial:
+                        raise
+                    break
+                index = self.__index
+                count += 1
+        self.__index = index
+        return count
+
+    def _read_run(self, result, tag, limit):
+        """
+        读取从当前位置开始连续的、类型标记均为tag的定长元素，取出类型标记之间的字节整块转换后放入array.array
+        :param result: array.array，itemsize与元素除去类型标记的宽度相同
+        :param tag: 元素的类型标记
+        :param limit: 最多读取的元素数量
+        :return: 读取的元素数量，只读取完整的元素，当前位置的元素不完整时为0
+        """
+        data = self.__data
+        index = self.__index
+        width = result.itemsize
+        step = width + 1
+        typecode = result.typecode
+        tags_prefix = bytes((tag,))
+        limit = min(limit, (len(data) - index) // step)
+        # 从每个元素的类型标记中统计连续的数量，检查的范围逐次加倍，避免短的连续段反复扫描后面的数据
+        run, probe = 0, 16
+        while run < limit:
+            tags = data[index + run * step:index + min(limit, run + probe) * step:step]
+            matched = len(tags) - len(tags.lstrip(tags_prefix))
+            run += matched
+            if matched < len(tags):
+                break
+            probe *= 2
+        end = index + run * step
+        if run < _PACKED_RUN:
+            # 较短的连续段跳过类型标记直接解码
+            result.extend(unpack_from('>' + ('x' + typecode) * run, data, index))
+        else:
+            packed = bytearray(run * width)
+            for i in range(width):
+                packed[i::width] = data[index + 1 + i:end:step]
+            # 结果为空时直接转换，不额外复制
+            values = result if not result else array(typecode)
+            values.frombytes(packed)
+            del packed
+            if not _BIG_ENDIAN:
+                values.byteswap()
+            if values is not result:
+                result.extend(values)
+        self.__index = end
+        return run
+
+    def _wrap_array(self, result, slot):
+        """
+        基本类型数组读取完成后，按照array_mode转换为最终的结果并更新引用列表
+        :param result: array.array
+        :param slot: 在引用列表中的位置
+        :return:
+        """
+        if self.array_mode == 'numpy':
+            result = self.objects[slot] = numpy.frombuffer(result, dtype=result.typecode)
+        return result
+
+    def _read_items(self, result, length):
+        """
+        读取列表中的length个元素，单字节/两字节整数、短字符串、null、布尔值、double直接在循环中解码，连续的日期整块解码，其余的交给read_next
+        :param result: 存放元素的列表
+        :param length: 元素数量
+        :return: result
+        """
+        data = self.__data
+        size = len(data)
+        read_next = self.read_next
+        append = result.append
+        index = self.__index
+        counter = iter(range(length))
+        for i in counter:
+            value = data[index]
+            if 0x80 <= value <= 0xbf:
+                append(value - 0x90)
+                index += 1
+            elif value <= 0x1f and index + 1 + value <= size:
+                end = index + 1 + value
+                try:
+                    append(data[index + 1:end].decode('ascii'))
+                except UnicodeDecodeError:
+                    self.__index = index
+                    append(read_next())
+                    index = self.__index
+                else:
+                    index = end
+            elif 0xc0 <= value <= 0xcf:
+                append((value - 0xc8) << 8 | data[index + 1])
+                index += 2
+            elif value == 0x44:  # 'D'
+                append(unpack_from('!d', data, index + 1)[0])
+                index += 9
+            elif value == 0x4e:  # 'N'
+                append(None)
+                index += 1
+            elif value == 0x54:  # 'T'
+                append(True)
+                index += 1
+            elif value == 0x46:  # 'F'
+                append(False)
+                index += 1
+            elif value == 0x48:  # 'H'，嵌套的dict
+                item = {}
+                self.objects.append(item)
+                append(self._read_entries(item, index + 1))
+                index = self.__index
+            elif value == 0x4a and index + 18 <= size and data[index + 9] == 0x4a:  # 连续的日期
+                self.__index = index
+                run = self._read_dates(result, length - i)
+                index = self.__index
+                next(islice(counter, run - 1, run - 1), None)  # 跳过已经读取的元素
+            else:
+                self.__index = index
+                append(read_next())
+                index = self.__index
+        self.__index = index
         return result
 
     @ranges((0xd8, 0xff), (0x38, 0x3f), 0x59, ord('L'))
@@ -313,20 +1114,24 @@ class Response(object):
         读取一个long类型的数字
         :return:
         """
-        value = self.read_byte()
+        data = self.__data
+        index = self.__index
+        value = data[index]
         if 0xd8 <= value <= 0xef:
-            result = value - 0xe0
+            self.__index = index + 1
+            return value - 0xe0
         elif 0xf0 <= value <= 0xff:
-            result = ((value - 0xf8) << 8) | self.read_byte()
+            self.__index = index + 2
+            return (value - 0xf8) << 8 | data[index + 1]
         elif 0x38 <= value <= 0x3f:
-            i = (value - 0x3c) << 16
-            i |= self.read_byte() << 8
-            i |= self.read_byte()
-            result = i
+            self.__index = index + 3
+            return (value - 0x3c) << 16 | data[index + 1] << 8 | data[index + 2]
         elif value == 0x59:
-            result = unpack('!i', self.read_bytes(4))[0]
+            result = unpack_from('!i', data, index + 1)[0]
+            self.__index = index + 5
         elif value == ord('L'):
-            result = unpack('!q', self.read_bytes(8))[0]
+            result = unpack_from('!q', data, index + 1)[0]
+            self.__index = index + 9
         else:
             raise RPCConnError('{0} is not long type'.format(value))
         return result
@@ -354,30 +1159,112 @@ class Response(object):
         if value == ord('M') or value == ord('H'):
             result = {}
             self.objects.append(result)
-            while self.get_byte() != ord('Z'):
-                key = self.read_next()
-                value = self.read_next()
-                result[key] = value
-            self.read_byte()  # 干掉最后一个'Z'字符
-            return result
+            if value == ord('M'):
+                _type = self.read_type()  # 有类型的map，type对于Python来说没有用处
+            return self._read_entries(result, self.__index)
         else:
             raise RPCConnError('{0} is not a map.'.format(value))
 
+    def _read_entries(self, result, index):
+        """
+        从index开始读取dict的键值对直到'Z'
+        键通常是短字符串，值为单字节/两字节整数、短字符串、null、布尔值、double时直接在循环中解码，其余的交给read_next
+        :param result: 存放键值对的dict
+        :param index: 第一个键的位置
+        :return: result
+        """
+        data = self.__data
+        size = len(data)
+        read_next = self.read_next
+        value = data[index]
+        while value != 0x5a:  # 'Z'
+            # 键
+            end = index + 1 + value
+            if value <= 0x1f and end <= size:
+                try:
+                    key = data[index + 1:end].decode('ascii')
+                except UnicodeDecodeError:
+                    self.__index = index
+                    key = read_next()
+                    end = self.__index
+            else:
+                self.__index = index
+                key = read_next()
+                end = self.__index
+
+            # 值
+            value = data[end]
+            if 0x80 <= value <= 0xbf:
+                result[key] = value - 0x90
+                index = end + 1
+            elif value <= 0x1f and end + 1 + value <= size:
+                index = end + 1 + value
+                try:
+                    result[key] = data[end + 1:index].decode('ascii')
+                except UnicodeDecodeError:
+                    self.__index = end
+                    result[key] = read_next()
+                    index = self.__index
+            elif 0xc0 <= value <= 0xcf:
+                result[key] = (value - 0xc8) << 8 | data[end + 1]
+                index = end + 2
+            elif value == 0x44:  # 'D'
+                result[key] = unpack_from('!d', data, end + 1)[0]
+                index = end + 9
+            elif value == 0x4e:  # 'N'
+                result[key] = None
+                index = end + 1
+            elif value == 0x54:  # 'T'
+                result[key] = True
+                index = end + 1
+            elif value == 0x46:  # 'F'
+                result[key] = False
+                index = end + 1
+            elif value == 0x48:  # 'H'，嵌套的dict
+                item = {}
+                self.objects.append(item)
+                result[key] = self._read_entries(item, end + 1)
+                index = self.__index
+            else:
+                self.__index = end
+                result[key] = read_next()
+                index = self.__index
+            value = data[index]
+        self.__index = index + 1  # 干掉最后一个'Z'字符
+        return result
+
     @ranges(0x4a, 0x4b)
     def read_date(self):
         """
-        读取一个date类型的值
+        读取一个date类型的值，按照date_mode转换
         :return:
         """
-        value = self.read_byte()
+        data = self.__data
+        index = self.__index
+        value = data[index]
         if value == 0x4a:
-            timestamp = unpack('!q', self.read_bytes(8))[0]
-        elif value == 0x4b:
-            timestamp = unpack('!i', self.read_bytes(4))[0]
-            timestamp *= 60000
+            millis = unpack_from('!q', data, index + 1)[0]
+            self.__index = index + 9
+        elif value == 0x4b:  # 精确到分钟
+            millis = unpack_from('!i', data, index + 1)[0] * 60000
+            self.__index = index + 5
         else:
             raise RPCConnError('{0} is not date type'.format(value))
-        return datetime.fromtimestamp(timestamp / 1e3).strftime("%Y-%m-%dT%H:%M:%S.%f+0800")
+        convert = self.convert_date
+        return millis if convert is None else convert(millis)
+
+    def _read_dates(self, result, length):
+        """
+        读取列表中连续的毫秒精度的日期，时间戳整块解码后统一转换
+        :param result: 存放元素的列表
+        :param length: 最多读取的数量
+        :return: 读取的数量
+        """
+        millis = array('q')
+        count = self._read_run(millis, 0x4a, length)
+        convert = self.convert_date
+        result.extend(millis if convert is None else map(convert, millis))
+        return count
 
     @ranges(0x51)
     def read_ref(self):
@@ -387,32 +1274,90 @@ class Response(object):
         """
         self.read_byte()  # 干掉0x51
         ref_id = self.read_int()
-        return self.objects[ref_id]
+        value = self.objects[ref_id]
+        if value is _TABLE_ROW or value is _PENDING:
+            value = self._resolve_ref(ref_id)
+        return value
+
+    def _resolve_ref(self, slot):
+        """
+        引用的值尚未创建，目前只有按列解码的列表中的一行，找到所在的列表并转换为对象
+        :param slot: 在引用列表中的位置
+        :return:
+        """
+        for table in self.tables:
+            row = bisect_left(table[2], slot)
+            if row < len(table[2]) and table[2][row] == slot:
+                value = self.objects[slot] = self._table_row(table, row)
+                return value
+        raise RPCConnError('Unknown reference {}'.format(slot))
 
     def read_next(self):
         """
         读取下一个变量，自动识别变量类型
+        出现最频繁的单字节整数、短字符串、null、布尔值、短小列表以及dict直接在这里处理，其余的类型查表分派
         :return:
         """
-        data_type = self.get_byte()
-        func = functions[data_type]
-        return func(self)
+        data = self.__data
+        index = self.__index
+        value = data[index]
+        # 单字节的整数
+        if 0x80 <= value <= 0xbf:
+            self.__index = index + 1
+            return value - 0x90
+        # 短字符串，ASCII时直接解码
+        if value <= 0x1f:
+            index += 1
+            end = index + value
+            if end <= len(data):
+                try:
+                    string = data[index:end].decode('ascii')
+                except UnicodeDecodeError:
+                    pass
+                else:
+                    self.__index = end
+                    return string
+            self.__index = index
+            return self._read_utf(value)
+        # 两个字节的整数
+        if 0xc0 <= value <= 0xcf:
+            self.__index = index + 2
+            return (value - 0xc8) << 8 | data[index + 1]
+        if value == 0x4e:  # 'N'
+            self.__index = index + 1
+            return None
+        if value == 0x54:  # 'T'
+            self.__index = index + 1
+            return True
+        if value == 0x46:  # 'F'
+            self.__index = index + 1
+            return False
+        # 单字节的long
+        if 0xd8 <= value <= 0xef:
+            self.__index = index + 1
+            return value - 0xe0
+        # 无类型的dict
+        if value == 0x48:  # 'H'
+            result = {}
+            self.objects.append(result)
+            return self._read_entries(result, index + 1)
+        # 固定长度的无类型短小列表
+        if 0x78 <= value <= 0x7f:
+            self.__index = index + 1
+            result = []
+            self.objects.append(result)
+            if self.table_mode != 'rows':
+                return self._read_table(result, len(self.objects) - 1, value - 0x78)
+            return self._read_items(result, value - 0x78)
+        return _handlers[value](self)
 
     def read_error(self):
         """
         解析Java的错误信息，因为需要知道错误的类型，所以需要单独处理
         :return:
         """
-        self.read_byte()
-        error_type = self.read_string()
-        self.paths.append(error_type)
-
-        field_length = self.read_int()
-        field_names = []
-        for i in range(field_length):
-            field_names.append(self.read_string())
-        self.field_names.append(field_names)
-
+        error_type = self._read_class_definition()
+        self.object_classes[-1] = None  # 错误信息中需要加入cause，始终使用dict
         error = self.read_object()
         error['cause'] = error_type
         return error
@@ -421,6 +1366,888 @@ class Response(object):
         return str(self.__data)
 
 
+def _read_unknown(response):
+    """
+    分派表中未定义的类型
+    :param response:
+    :return:
+    """
+    raise RPCConnError('Unknown data type {0}'.format(response.get_byte()))
+
+
+# 按照首字节分派的处理方法，共256项
+_handlers = tuple(functions.get(i, _read_unknown) for i in range(256))
+
+
+_LIST_FRAME, _MAP_FRAME, _OBJECT_FRAME, _ARRAY_FRAME, _TABLE_FRAME = range(5)
+# 列表开头的字节
+_LIST_TAGS = frozenset(list(range(0x55, 0x59)) + list(range(0x70, 0x80)))
+# 无类型的列表开头的字节
+_UNTYPED_LIST_TAGS = frozenset([0x57, 0x58] + list(range(0x78, 0x80)))
+
+
+class IncrementalResponse(Response):
+    """
+    增量解析的响应，响应体分多次通过feed传入，每次传入后尽可能多地解析
+    列表、dict、对象在解析的过程中保存在栈中，其余的值在数据足够时整体读取，数据不足时回到这个值的开头等待后续的数据
+    已经解析过的数据会被及时丢弃，不需要同时保存完整的响应体和解析结果
+    """
+
+    def __init__(self, length=None, **options):
+        """
+        :param length: 响应体的总长度，数据全部到达后剩余的部分直接按照Response的方式解析，未知时需要在最后调用close
+        :param options: 传给Response的解码选项
+        """
+        super(IncrementalResponse, self).__init__(bytearray(), **options)
+        self.values = []  # 已经解析完成的顶层的值
+        self.__length = length
+        self.__received = 0  # 已经传入的字节数
+        self.__waiting = 0  # 数据不足时，已经传入的字节数至少达到此值再重新尝试
+        # 正在解析的列表、dict、对象：
+        # [_LIST_FRAME, 列表, 剩余的元素数量（可变长度的列表为None）]
+        # [_MAP_FRAME, dict, 已经读取的键, 是否已经读取了键]
+        # [_OBJECT_FRAME, 对象, 字段名, 已经读取的字段数量, 在引用列表中的位置, 类路径, 已经读取的字段值]
+        # 解码为生成的类时先创建空的实例，字段值保存在列表中，全部读取后再调用构造方法；解码为dict时字段值列表为None
+        # [_ARRAY_FRAME, array.array, 剩余的元素数量, 在引用列表中的位置, 定长元素的类型标记, 单字节的元素]
+        # 基本类型数组的元素不入栈，每次传入数据后整块读取所有完整的元素
+        # [_TABLE_FRAME, 列表, 剩余的元素数量（可变长度的列表为None）, 按列解码的列表, 在引用列表中的位置]
+        # 按列解码的列表每次读取完整的一行，出现其他类型的元素时转换为_LIST_FRAME
+        self.__stack = []
+
+    def feed(self, chunk):
+        """
+        传入一段响应数据并尽可能多地解析
+        :param chunk:
+        :return:
+        """
+        self.__received += len(chunk)
+        # 已经读取的部分多于未读取的部分时才丢弃，每个字节最多被移动一次
+        self._extend(chunk, self.tell() > self.length())
+        if self.__received == self.__length:
+            self._drain()
+        elif self.__received >= self.__waiting:
+            self._advance()
+
+    def close(self):
+        """
+        总长度未知时，在数据全部传入后调用，解析剩余的部分
+        :return:
+        """
+        if self.__length is None:
+            self.__length = self.__received
+            self._drain()
+
+    def finished(self):
+        """
+        响应体是否已经全部传入并解析完成
+        :return:
+        """
+        return self.__received == self.__length and not self.__stack and self.length() <= 0
+
+    def _deliver(self, value):
+        """
+        把解析完成的值放入所属的列表、dict、对象中
+        :param value:
+        :return:
+        """
+        stack = self.__stack
+        if not stack:
+            self.values.append(value)
+            return
+        frame = stack[-1]
+        kind = frame[0]
+        if kind == _LIST_FRAME:
+            frame[1].append(value)
+            if frame[2] is not None:
+                frame[2] -= 1
+        elif kind == _MAP_FRAME:
+            if frame[3]:
+                frame[1][frame[2]] = value
+                frame[3] = False
+            else:
+                frame[2] = value
+                frame[3] = True
+        elif frame[6] is None:
+            frame[1][frame[2][frame[3]]] = value
+            frame[3] += 1
+        else:
+            frame[6].append(value)
+            frame[3] += 1
+
+    def _advance(self):
+        """
+        在数据不完整的情况下尽可能多地解析
+        :return:
+        """
+        stack = self.__stack
+        objects = self.objects
+        while True:
+            frame = stack[-1] if stack else None
+            if frame is not None:
+                kind = frame[0]
+                if kind == _ARRAY_FRAME:
+                    frame[2] -= self._read_packed(frame[1], frame[2], frame[4], frame[5], True)
+                    if frame[2]:
+                        return
+                    stack.pop()
+                    self._deliver(self._wrap_array(frame[1], frame[3]))
+                    continue
+                if kind == _TABLE_FRAME:
+                    if not self._advance_table(frame):
+                        return
+                    continue
+                if kind == _LIST_FRAME and frame[2] == 0:
+                    stack.pop()
+                    self._deliver(frame[1])
+                    continue
+                if kind == _OBJECT_FRAME and frame[3] == len(frame[2]):
+                    stack.pop()
+                    self._deliver(self._complete_object(frame))
+                    continue
+
+            if self.length() <= 0:
+                return
+            position = self.tell()
+            value = self.get_byte()
+            if value == ord('Z') and frame is not None and (
+                    kind == _MAP_FRAME and not frame[3] or kind == _LIST_FRAME and frame[2] is None):
+                self.read_byte()
+                stack.pop()
+                self._deliver(frame[1])
+                continue
+
+            sizes = self._sizes()
+            try:
+                # 先尝试整体读取，通常只有缓冲区末尾的值会因为数据不足而失败
+                self._deliver(self.read_next())
+                continue
+            except (IndexError, StructError):
+                self._rollback(position, sizes)
+            try:
+                # 数据不足时列表、dict、对象只读取开头并入栈，其中的值逐个解析
+                if value in _LIST_TAGS:
+                    result = []
+                    slot = len(objects)
+                    objects.append(result)
+                    _type, length = self._read_list_head()
+                    if length is not None and self.array_mode != 'list' and _type in _PRIMITIVE_LISTS:
+                        typecode, tag, compact = _PRIMITIVE_LISTS[_type]
+                        result = objects[slot] = array(typecode)
+                        stack.append([_ARRAY_FRAME, result, length, slot, tag, compact])
+                    elif self.table_mode != 'rows' and _type not in _PRIMITIVE_LISTS:
+                        table = [None, None, array('q'), None]
+                        self.tables.append(table)
+                        stack.append([_TABLE_FRAME, result, length, table, slot])
+                    else:
+                        stack.append([_LIST_FRAME, result, length])
+                elif value == ord('H') or value == ord('M'):
+                    self.read_byte()
+                    result = {}
+                    objects.append(result)
+                    if value == ord('M'):
+                        self.read_type()
+                    stack.append([_MAP_FRAME, result, None, False])
+                elif 0x60 <= value <= 0x6f or value == ord('O'):
+                    slot = len(objects)
+                    ref = self._read_object_head()
+                    cls = self.object_classes[ref]
+                    result = {} if cls is None else cls.__new__(cls)
+                    objects.append(result)
+                    stack.append([_OBJECT_FRAME, result, self.field_names[ref], 0, slot, self.paths[ref],
+                                  None if cls is None else []])
+                elif value == ord('C'):
+                    self._read_class_definition()
+                else:
+                    raise IndexError('Not enough data')
+            except (IndexError, StructError):
+                self._rollback(position, sizes)
+                self._wait()
+                return
+
+    def _advance_table(self, frame):
+        """
+        读取按列解码的列表中所有完整的行，数据不足时回到这一行的开头
+        :param frame: _TABLE_FRAME
+        :return: 列表读取完成或者转换为普通的列表时返回True，数据不足时返回False
+        """
+        table = frame[3]
+        read_row = self._read_row
+        while frame[2] != 0:
+            if self.length() <= 0:
+                return False
+            position = self.tell()
+            if frame[2] is None and self.get_byte() == ord('Z'):
+                self.read_byte()
+                break
+            sizes = self._sizes()
+            rows = len(table[2])
+            try:
+                if not read_row(table):
+                    # 出现其他类型的元素，剩余的部分按照普通的列表解析
+                    self._untable(table, frame[1])
+                    frame[:] = [_LIST_FRAME, frame[1], frame[2]]
+                    return True
+            except (IndexError, StructError):
+                self._rollback(position, sizes)
+                del table[2][rows:]
+                for column in table[1] or ():
+                    del column[rows:]
+                self._wait()
+                return False
+            if frame[2] is not None:
+                frame[2] -= 1
+        self.__stack.pop()
+        self._deliver(self._finish_table(table, frame[4], frame[1]))
+        return True
+
+    def _wait(self):
+        """
+        数据不足，未读取的数据增加一倍后再尝试，避免较大的值被反复地读取
+        :return:
+        """
+        self.__waiting = self.__received + self.length()
+        if self.__length is not None:
+            self.__waiting = min(self.__waiting, self.__length)
+
+    def _sizes(self):
+        """
+        :return: 引用列表、类型列表、类定义列表、按列解码的列表的长度，用于读取失败时回滚
+        """
+        return len(self.objects), len(self.types), len(self.paths), len(self.tables)
+
+    def _rollback(self, position, sizes):
+        """
+        回到读取失败的值的开头，并移除读取过程中加入的引用、类型、类定义、按列解码的列表
+        :param position: 值的开头
+        :param sizes: 读取前引用列表、类型列表、类定义列表、按列解码的列表的长度
+        :return:
+        """
+        self.seek(position)
+        del self.objects[sizes[0]:]
+        del self.types[sizes[1]:]
+        del self.paths[sizes[2]:]
+        del self.field_names[sizes[2]:]
+        del self.object_classes[sizes[2]:]
+        del self.tables[sizes[3]:]
+
+    def _complete_object(self, frame):
+        """
+        对象的字段已经全部读取，返回最终的结果
+        :param frame:
+        :return:
+        """
+        result = frame[1]
+        if frame[6] is None:
+            return self._convert_object(frame[5], result, frame[4])
+        result.__init__(*frame[6])
+        return result
+
+    def _drain(self):
+        """
+        数据已经全部到达，剩余的部分不会再出现数据不足的情况，直接按照Response的方式解析
+        :return:
+        """
+        stack = self.__stack
+        read_next = self.read_next
+        while stack:
+            frame = stack.pop()
+            kind = frame[0]
+            result = frame[1]
+            if kind == _ARRAY_FRAME:
+                self._read_packed(result, frame[2], frame[4], frame[5])
+                result = self._wrap_array(result, frame[3])
+            elif kind == _TABLE_FRAME:
+                result = self._read_rows(result, frame[4], frame[3], frame[2])
+            elif kind == _LIST_FRAME:
+                if frame[2] is None:
+                    while self.get_byte() != ord('Z'):
+                        result.append(read_next())
+                    self.read_byte()
+                else:
+                    self._read_items(result, frame[2])
+            elif kind == _MAP_FRAME:
+                if frame[3]:
+                    result[frame[2]] = read_next()
+                self._read_entries(result, self.tell())
+            else:
+                for field_name in frame[2][frame[3]:]:
+                    if frame[6] is None:
+                        result[field_name] = read_next()
+                    else:
+                        frame[6].append(read_next())
+                result = self._complete_object(frame)
+            self._deliver(result)
+
+        while self.length() > 0:
+            self.values.append(read_next())
+
+
+def _get_fixed_sizes():
+    """
+    长度固定的值（整数、long、浮点数、日期、null、布尔值）按照首字节对应的总字节数，其余的为0
+    :return:
+    """
+    sizes = [0] * 256
+    fixed = [((0x80, 0xbf), 1), ((0xc0, 0xcf), 2), ((0xd0, 0xd7), 3), ((0x49, 0x49), 5),
+             ((0xd8, 0xef), 1), ((0xf0, 0xff), 2), ((0x38, 0x3f), 3), ((0x59, 0x59), 5), ((0x4c, 0x4c), 9),
+             ((0x5b, 0x5c), 1), ((0x5d, 0x5d), 2), ((0x5e, 0x5e), 3), ((0x5f, 0x5f), 5), ((0x44, 0x44), 9),
+             ((0x4a, 0x4a), 9), ((0x4b, 0x4b), 5), ((0x4e, 0x4e), 1), ((0x54, 0x54), 1), ((0x46, 0x46), 1)]
+    for (start, end), size in fixed:
+        for i in range(start, end + 1):
+            sizes[i] = size
+    return tuple(sizes)
+
+
+_FIXED_SIZES = _get_fixed_sizes()
+# 对象、列表、dict开头的字节
+_CONTAINER_TAGS = _LIST_TAGS | frozenset([0x48, 0x4d, 0x4f] + list(range(0x60, 0x70)))
+# 尚未解析的对象、列表、dict在引用列表中的占位
+_PENDING = object()
+
+
+class LazyResponse(Response):
+    """
+    延迟解析的响应，read_lazy先跳过整个值并记录其中每个对象、列表、dict的位置，然后返回只读的代理对象，
+    其中的值在第一次访问时才从响应数据中解析并缓存，适用于返回值很大但只会用到其中少部分内容的情况
+    跳过的过程中会登记引用和类定义，所以引用(0x51)可以指向尚未访问的部分
+    代理对象共享同一个响应，不能在多个线程中同时访问
+    列表始终解码为LazyList，table_mode不起作用
+    """
+
+    def __init__(self, data, **options):
+        super(LazyResponse, self).__init__(data, **options)
+        self.__data = data
+        self.__starts = array('q')  # 每个对象、列表、dict的开始位置，按照引用编号排列
+        self.__ends = array('q')  # 每个对象、列表、dict的结束位置
+        self.__nexts = array('q')  # 每个对象、列表、dict之后的下一个引用编号，即跳过其中所有嵌套的对象、列表、dict
+        self.__definitions = {}  # 类定义的开始位置 -> 结束位置
+
+    def read_lazy(self):
+        """
+        读取下一个值，对象、列表、dict返回代理对象
+        :return:
+        """
+        index = self.tell()
+        end = self._scan(index)
+        value = self._lazy_value(index)
+        self.seek(end)
+        return value
+
+    def read_projected(self, fields):
+        """
+        读取下一个值，只解码fields中的字段，其余的值只跳过并登记引用和类定义，不创建Python对象
+        :param fields: 需要的字段路径，用'.'分隔，例如：['id', 'owner.name', 'items.price']
+                       列表中的每个元素使用相同的字段路径，路径中途的值不是对象或者dict时原样返回
+        :return: 对象和dict只包含需要的字段并解码为dict，需要的字段中的值与Response的解析结果相同
+        """
+        return self._read_projected(_parse_projection(fields), {})
+
+    def _read_projected(self, tree, memo):
+        """
+        按照字段树读取当前位置的值，对象、列表、dict在读取的过程中登记，不需要的字段直接跳过
+        跳过的对象、列表、dict同read_lazy一样登记位置，之后被引用时通过代理对象解析
+        :param tree: {字段名: 子树}，为None时读取整个值
+        :param memo: 见_project
+        :return:
+        """
+        data = self.__data
+        index = self.tell()
+        value = data[index]
+        while value == 0x43:  # 'C'
+            self._read_class_definition()
+            index = self.tell()
+            value = data[index]
+        if tree is None or value not in _CONTAINER_TAGS:
+            return self._project(self.read_lazy(), tree, memo)
+
+        # 登记这个对象、列表、dict，不会被代理对象访问，只需要占用引用编号
+        result = {}
+        objects = self.objects
+        slot = len(objects)
+        objects.append(result)
+        self.__starts.append(index)
+        self.__ends.append(0)
+        self.__nexts.append(0)
+        memo[(id(result), id(tree))] = result
+
+        read_projected = self._read_projected
+        if value in _LIST_TAGS:
+            result = objects[slot] = memo[(id(result), id(tree))] = []
+            length = self._read_list_head()[1]
+            while length is None and data[self.tell()] != 0x5a or length is not None and len(result) < length:
+                result.append(read_projected(tree, memo))
+            if length is None:
+                self.read_byte()
+            return result
+
+        if value == 0x48 or value == 0x4d:  # 'H'、'M'
+            self.read_byte()
+            if value == 0x4d:
+                self.read_type()
+            while data[self.tell()] != 0x5a:
+                key = read_projected(None, memo)
+                if key in tree:
+                    result[key] = read_projected(tree[key], memo)
+                else:
+                    self.seek(self._skip_unwanted(self.tell()))
+            self.read_byte()
+            return result
+
+        ref = self._read_object_head()
+        size = len(data)
+        search = _NON_ASCII.search
+        index = self.tell()
+        for field_name in self.field_names[ref]:
+            if field_name in tree:
+                self.seek(index)
+                result[field_name] = read_projected(tree[field_name], memo)
+                index = self.tell()
+                continue
+            # 与_skip_unwanted相同，定长的值与ASCII字符串直接在循环中跳过
+            value = data[index]
+            fixed = _FIXED_SIZES[value]
+            if fixed:
+                index += fixed
+                continue
+            if value <= 0x1f:
+                end = index + 1 + value
+                if end <= size and search(data, index + 1, end) is None:
+                    index = end
+                    continue
+            elif 0x30 <= value <= 0x33:
+                start = index + 2
+                end = start + ((value - 0x30) << 8 | data[index + 1])
+                if end <= size and search(data, start, end) is None:
+                    index = end
+                    continue
+            index = self._scan(index)
+        self.seek(index)
+        return self._convert_object(self.paths[ref], result, slot)
+
+    def _skip_unwanted(self, index):
+        """
+        跳过不需要的值，定长的值与ASCII字符串直接跳过，其余的通过_scan跳过并登记
+        :param index: 值的开始位置
+        :return: 值的结束位置
+        """
+        data = self.__data
+        value = data[index]
+        fixed = _FIXED_SIZES[value]
+        if fixed:
+            return index + fixed
+        if value <= 0x1f:
+            start = index + 1
+            end = start + value
+        elif 0x30 <= value <= 0x33:
+            start = index + 2
+            end = start + ((value - 0x30) << 8 | data[index + 1])
+        else:
+            return self._scan(index)
+        if end <= len(data) and _NON_ASCII.search(data, start, end) is None:
+            return end
+        return self._scan(index)
+
+    def _project(self, value, tree, memo):
+        """
+        按照字段树把代理对象转换为普通的list、dict
+        :param value: 代理对象或者已经解析的值
+        :param tree: {字段名: 子树}，为None时转换整个值
+        :param memo: (id(代理对象), id(字段树)) -> 转换结果，同一个值被多次引用时只转换一次，并且可以处理循环引用
+        :return:
+        """
+        if not isinstance(value, (LazyList, LazyMap)):
+            return value
+        key = (id(value), id(tree))
+        try:
+            return memo[key]
+        except KeyError:
+            pass
+        project = self._project
+        if isinstance(value, LazyList):
+            result = memo[key] = []
+            for item in value:
+                result.append(project(item, tree, memo))
+        elif tree is None:
+            result = memo[key] = {}
+            for name, item in value.items():
+                result[name] = project(item, None, memo)
+        else:
+            result = memo[key] = {}
+            for name, subtree in tree.items():
+                if name in value:
+                    result[name] = project(value[name], subtree, memo)
+        return result
+
+    def _scan(self, index):
+        """
+        跳过index处的一个值，登记其中的对象、列表、dict的位置、类定义以及泛型，不创建任何对象
+        嵌套的层级保存在栈中，不需要递归调用
+        :param index: 值的开始位置
+        :return: 值的结束位置
+        """
+        data = self.__data
+        size = len(data)
+        objects = self.objects
+        starts = self.__starts
+        ends = self.__ends
+        nexts = self.__nexts
+        field_names = self.field_names
+        search = _NON_ASCII.search
+        skip = self._skip
+        stack = []
+        slot = -1  # 当前所在的对象、列表、dict的引用编号
+        remaining = 1  # 当前层级剩余的值的数量，以'Z'结尾的列表、dict为None
+        while True:
+            if remaining == 0:
+                if not stack:
+                    return index
+                ends[slot] = index
+                nexts[slot] = len(objects)
+                slot, remaining = stack.pop()
+                continue
+            value = data[index]
+            if value == 0x5a and remaining is None:  # 'Z'
+                index += 1
+                ends[slot] = index
+                nexts[slot] = len(objects)
+                slot, remaining = stack.pop()
+                continue
+            if value == 0x43:  # 'C'，类定义，之后紧跟着一个对象
+                self.seek(index)
+                self._read_class_definition()
+                self.__definitions[index] = index = self.tell()
+                continue
+
+            if remaining is not None:
+                remaining -= 1
+            fixed = _FIXED_SIZES[value]
+            if fixed:
+                index += fixed
+            elif value <= 0x1f:
+                end = index + 1 + value
+                if end <= size and search(data, index + 1, end) is None:
+                    index = end
+                else:
+                    index = _utf8_extent(data, index + 1, value)
+            elif value in _CONTAINER_TAGS:
+                stack.append((slot, remaining))
+                slot = len(objects)
+                objects.append(_PENDING)
+                starts.append(index)
+                ends.append(0)
+                nexts.append(0)
+                if 0x78 <= value <= 0x7f:
+                    remaining = value - 0x78
+                    index += 1
+                elif 0x60 <= value <= 0x6f:
+                    remaining = len(field_names[value - 0x60])
+                    index += 1
+                elif value == 0x48:  # 'H'
+                    remaining = None
+                    index += 1
+                else:
+                    self.seek(index)
+                    if value in _LIST_TAGS:
+                        remaining = self._read_list_head()[1]
+                    elif value == 0x4d:  # 'M'
+                        self.read_byte()
+                        self.read_type()
+                        remaining = None
+                    else:
+                        remaining = len(field_names[self._read_object_head()])
+                    index = self.tell()
+            else:
+                index = skip(index)
+
+    def _skip(self, index):
+        """
+        跳过index处已经登记过的一个值，不创建任何对象，对象、列表、dict直接使用记录的结束位置
+        :param index: 值的开始位置
+        :return: 值的结束位置
+        """
+        data = self.__data
+        value = data[index]
+        size = _FIXED_SIZES[value]
+        if size:
+            return index + size
+
+        # 字符串
+        if value <= 0x1f or 0x30 <= value <= 0x33 or value == 0x52 or value == 0x53:
+            while value == 0x52:  # 'R'，非最后一个分块
+                index = _utf8_extent(data, index + 3, unpack_from('!H', data, index + 1)[0])
+                value = data[index]
+            if value <= 0x1f:
+                return _utf8_extent(data, index + 1, value)
+            if value == 0x53:  # 'S'
+                return _utf8_extent(data, index + 3, unpack_from('!H', data, index + 1)[0])
+            return _utf8_extent(data, index + 2, (value - 0x30) << 8 | data[index + 1])
+        # 二进制数据
+        if 0x20 <= value <= 0x2f or 0x34 <= value <= 0x37 or value == 0x41 or value == 0x42:
+            while value == 0x41:  # 'A'，非最后一个分块
+                index += 3 + unpack_from('!H', data, index + 1)[0]
+                value = data[index]
+            if value == 0x42:  # 'B'
+                return index + 3 + unpack_from('!H', data, index + 1)[0]
+            if value <= 0x2f:
+                return index + 1 + value - 0x20
+            return index + 2 + ((value - 0x34) << 8 | data[index + 1])
+        # 引用
+        if value == 0x51:
+            return index + 1 + _FIXED_SIZES[data[index + 1]]
+        # 类定义，之后紧跟着一个对象
+        if value == 0x43:  # 'C'
+            return self._skip(self.__definitions[index])
+        if value in _CONTAINER_TAGS:
+            return self.__ends[bisect_left(self.__starts, index)]
+        raise RPCConnError('Unknown data type {0}'.format(value))
+
+    def _lazy_value(self, index):
+        """
+        获取index处的值，对象、列表、dict返回代理对象，其余的直接解析
+        :param index:
+        :return:
+        """
+        data = self.__data
+        value = data[index]
+        if value == 0x43:  # 'C'，跳过已经登记的类定义
+            index = self.__definitions[index]
+            value = data[index]
+
+        position = self.tell()
+        try:
+            if value == 0x51:
+                self.seek(index + 1)
+                return self._resolve(self.read_int())
+            if value in _CONTAINER_TAGS:
+                return self._resolve(bisect_left(self.__starts, index))
+            self.seek(index)
+            return self.read_next()
+        finally:
+            self.seek(position)
+
+    def _resolve_ref(self, slot):
+        """
+        read_next读取到指向已经跳过的对象、列表、dict的引用时创建代理对象
+        :param slot:
+        :return:
+        """
+        if self.objects[slot] is not _PENDING:
+            return super(LazyResponse, self)._resolve_ref(slot)
+        position = self.tell()
+        try:
+            return self._resolve(slot)
+        finally:
+            self.seek(position)
+
+    def _resolve(self, slot):
+        """
+        获取引用编号对应的值，第一次获取时创建代理对象
+        :param slot:
+        :return:
+        """
+        value = self.objects[slot]
+        if value is _PENDING:
+            value = self.objects[slot] = self._create_proxy(slot)
+        return value
+
+    def _create_proxy(self, slot):
+        """
+        为引用编号对应的对象、列表、dict创建代理对象，只记录其中每个值的位置
+        :param slot:
+        :return:
+        """
+        data = self.__data
+        index = self.__starts[slot]
+        value = data[index]
+
+        if value in _LIST_TAGS:
+            index += 1
+            if 0x70 <= value <= 0x77 or value == 0x56 or value == 0x55:
+                index = self._skip(index)  # 已经登记过的泛型
+            if 0x70 <= value <= 0x7f:
+                length = (value - 0x70) & 0x07
+            elif value == 0x56 or value == 0x58:
+                self.seek(index)
+                length = self.read_int()
+                index = self.tell()
+            else:
+                length = None
+            if length is not None and self.array_mode != 'list' and value not in _UNTYPED_LIST_TAGS:
+                # 基本类型数组占用的内存很少，直接整体解码
+                self.seek(self.__starts[slot] + 1)
+                _type = self.read_next()  # 已经登记过的泛型，不能再次通过read_type登记
+                if isinstance(_type, int):
+                    _type = self.types[_type]
+                if _type in _PRIMITIVE_LISTS:
+                    typecode, tag, compact = _PRIMITIVE_LISTS[_type]
+                    result = array(typecode)
+                    self.seek(index)
+                    self._read_packed(result, length, tag, compact)
+                    return self._wrap_array(result, slot)
+            return LazyList(self, self._child_offsets(index, slot + 1, length)[0])
+
+        if value == 0x48 or value == 0x4d:
+            index += 1
+            if value == 0x4d:  # 'M'
+                index = self._skip(index)
+            # 键和值交替排列，键在创建时就读取，短字符串的键直接解码值之前的字节
+            offsets = self._child_offsets(index, slot + 1, None)[0]
+            entries = {}
+            for i in range(0, len(offsets), 2):
+                index = offsets[i]
+                key = None
+                if data[index] <= 0x1f:
+                    try:
+                        key = data[index + 1:offsets[i + 1]].decode('utf-8')
+                    except UnicodeDecodeError:
+                        pass
+                if key is None:
+                    key = self._lazy_value(index)
+                entries[key] = offsets[i + 1]
+            return LazyMap(self, entries)
+
+        self.seek(index)
+        ref = self._read_object_head()
+        field_names = self.field_names[ref]
+        offsets = self._child_offsets(self.tell(), slot + 1, len(field_names))[0]
+        return self._convert_object(self.paths[ref], LazyMap(self, dict(zip(field_names, offsets))), slot)
+
+    def _child_offsets(self, index, cursor, length):
+        """
+        跳过从index开始的length个值，记录每个值的开始位置
+        :param index: 第一个值的位置
+        :param cursor: 下一个对象、列表、dict的引用编号，嵌套的对象、列表、dict通过记录的结束位置直接跳过
+        :param length: 值的数量，为None时一直读取到'Z'
+        :return: (每个值的开始位置, 结束位置, 之后的下一个引用编号)
+        """
+        data = self.__data
+        size = len(data)
+        ends = self.__ends
+        nexts = self.__nexts
+        definitions = self.__definitions
+        search = _NON_ASCII.search
+        skip = self._skip
+        offsets = array('q')
+        append = offsets.append
+        count = 0
+        while count != length:
+            value = data[index]
+            if length is None and value == 0x5a:  # 'Z'
+                break
+            append(index)
+            count += 1
+            fixed = _FIXED_SIZES[value]
+            if fixed:
+                index += fixed
+                continue
+            if value <= 0x1f:
+                end = index + 1 + value
+                if end <= size and search(data, index + 1, end) is None:
+                    index = end
+                    continue
+            if value == 0x43:  # 'C'，跳过已经登记的类定义
+                index = definitions[index]
+                value = data[index]
+            if value in _CONTAINER_TAGS:
+                index = ends[cursor]
+                cursor = nexts[cursor]
+            else:
+                index = skip(index)
+        return offsets, index, cursor
+
+
+def _parse_projection(fields):
+    """
+    把字段路径转换为字段树
+    :param fields: 字段路径，用'.'分隔
+    :return: {字段名: 子树}，子树为None时保留整个值
+    """
+    tree = {}
+    for field in fields:
+        node = tree
+        names = field.split('.')
+        for name in names[:-1]:
+            if name not in node:
+                node[name] = {}
+            node = node[name]
+            if node is None:  # 已经保留了上一级的整个值
+                break
+        else:
+            node[names[-1]] = None
+    return tree
+
+
+class LazyList(Sequence):
+    """
+    延迟解析的只读列表，元素在第一次访问时解析并缓存
+    """
+
+    def __init__(self, response, offsets):
+        """
+        :param response: 所属的响应
+        :param offsets: 每个元素在响应数据中的位置
+        """
+        self.__response = response
+        self.__offsets = offsets
+        self.__values = [_PENDING] * len(offsets)
+
+    def __len__(self):
+        return len(self.__offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.__offsets)))]
+        value = self.__values[index]
+        if value is _PENDING:
+            value = self.__values[index] = self.__response._lazy_value(self.__offsets[index])
+        return value
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence) or isinstance(other, (str, bytes)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    @recursive_repr()
+    def __repr__(self):
+        return 'LazyList(%r)' % list(self)
+
+
+class LazyMap(Mapping):
+    """
+    延迟解析的只读dict，也用于对象，值在第一次访问时解析并缓存
+    """
+
+    def __init__(self, response, offsets):
+        """
+        :param response: 所属的响应
+        :param offsets: 键 -> 值在响应数据中的位置
+        """
+        self.__response = response
+        self.__offsets = offsets
+        self.__values = {}
+
+    def __len__(self):
+        return len(self.__offsets)
+
+    def __iter__(self):
+        return iter(self.__offsets)
+
+    def __contains__(self, key):
+        return key in self.__offsets
+
+    def __getitem__(self, key):
+        try:
+            return self.__values[key]
+        except KeyError:
+            pass
+        value = self.__values[key] = self.__response._lazy_value(self.__offsets[key])
+        return value
+
+    @recursive_repr()
+    def __repr__(self):
+        return 'LazyMap(%r)' % dict(self)
+
+
 def parse_response_head(response_head):
     """
     对响应头部的字节做解析
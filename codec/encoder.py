@@ -13,14 +13,121 @@
 * double
 * java.lang.String
 * java.lang.Object
+* int[]/long[]/float[]/double[]/boolean[]（array.array或一维的numpy数组）
+* java.util.Map（dict）、java.util.Set（set）、java.util.Date（datetime/date）
+* java.math.BigDecimal（Decimal）、java.util.UUID（UUID）
+* byte[]（bytes、bytearray、memoryview）
+* List<Object>（JavaObjectBatch，由多行字典或者按列存储的数据批量编码）
+其他类型可以通过register_type注册
 """
 
+import math
+import re
 import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from itertools import repeat
+from uuid import UUID
 
 from mxsoftpy.exception import DataError
 
-from ..constants import MIN_INT_32, MAX_INT_32, DEFAULT_REQUEST_META
-from ..util import double_to_long_bits, get_invoke_id
+try:
+    import numpy
+except ImportError:  # numpy为可选依赖，没有安装时只支持array.array
+    numpy = None
+
+from ..constants import MIN_INT_32, MAX_INT_32, MAX_INT_64, DEFAULT_REQUEST_META, HEAD_LENGTH
+from ..util import get_invoke_id
+
+# 字符串分块的最大长度，参见：com.alibaba.com.caucho.hessian.io.Hessian2Output#writeString
+STRING_CHUNK_SIZE = 0x8000
+# 类结构中的字段类型对应的编码方法
+# 每个模板负责把字段值v写入buffer，N、T、F分别对应'N'、'T'、'F'，短小的整数和ASCII字符串直接内联编码
+_FIELD_ENCODERS = {
+    None: (
+        'encode_value(request, v)',
+    ),
+    'boolean': (
+        'append(78 if v is None else 84 if v else 70)',
+    ),
+    'int': (
+        'if v is None: append(78)',
+        'elif v is True or v is False: raise TypeError("bool is not int")',
+        'elif -0x10 <= v <= 0x2f: append(v + 0x90)',
+        'elif -0x800 <= v <= 0x7ff:',
+        '    append(0xc8 + (v >> 8))',
+        '    append(v & 0xff)',
+        'else: encode_int(request, v)',
+    ),
+    'long': (
+        'if v is None: append(78)',
+        'elif v is True or v is False: raise TypeError("bool is not long")',
+        'elif -0x08 <= v <= 0x0f: append(v + 0xe0)',
+        'elif -0x800 <= v <= 0x7ff:',
+        '    append(0xf8 + (v >> 8))',
+        '    append(v & 0xff)',
+        'else: encode_long(request, v)',
+    ),
+    'double': (
+        'if v is None: append(78)',
+        'else: encode_float(request, v)',
+    ),
+    'string': (
+        'if v is None: append(78)',
+        'elif len(v) <= 0x1f and v.isascii():',
+        '    append(len(v))',
+        '    buffer += v.encode("ascii")',
+        'else: encode_str(request, v)',
+    ),
+}
+_FIELD_ENCODERS['float'] = _FIELD_ENCODERS['double']
+# numpy的dtype.kind -> 字段类型
+_DTYPE_FIELD_TYPES = {'b': 'boolean', 'i': 'int', 'u': 'int', 'f': 'double'}
+_FIELD_ENCODERS['java.lang.String'] = _FIELD_ENCODERS['string']
+# 字段类型 -> 可以写入的python类型，编码出错时用来找出值与类型不符的字段
+_FIELD_VALUE_TYPES = {'int': int, 'long': int, 'double': (int, float), 'float': (int, float), 'string': str,
+                      'java.lang.String': str}
+# array.array的typecode -> hessian列表类型
+_ARRAY_TYPES = {
+    'b': '[int', 'B': '[int', 'h': '[int', 'H': '[int', 'i': '[int',
+    'I': '[long', 'l': '[long', 'L': '[long', 'q': '[long', 'Q': '[long',
+    'f': '[float', 'd': '[double',
+}
+# numpy的dtype.kind + itemsize -> hessian列表类型
+_NUMPY_TYPES = {
+    'b1': '[boolean',
+    'i1': '[int', 'i2': '[int', 'i4': '[int', 'u1': '[int', 'u2': '[int',
+    'i8': '[long', 'u4': '[long', 'u8': '[long',
+    'f4': '[float', 'f8': '[double',
+}
+# hessian列表类型 -> (元素的类型标记, array.array的typecode, numpy的dtype, 参数类型描述)
+# 元素使用定长的编码方式，这样就可以整块打包而不需要逐个元素判断，每个int占5个字节，long、double占9个字节
+_PACKED_ELEMENTS = {
+    '[int': (b'I', 'i', '>i4', '[I'),
+    '[long': (b'L', 'q', '>i8', '[J'),
+    '[float': (b'D', 'd', '>f8', '[F'),
+    '[double': (b'D', 'd', '>f8', '[D'),
+}
+# 整数数组的紧凑编码：hessian列表类型 -> ((最小值, 最大值, 每个元素的字节数, 把有符号字节转换为首字节的表), ...)
+# 所有元素都在范围内时整块打包为单字节或者双字节的整数，按照范围从小到大排列
+_COMPACT_ELEMENTS = {
+    '[int': ((-0x10, 0x2f, 1, bytes((i + 0x90) & 0xff for i in range(256))),
+             (-0x800, 0x7ff, 2, bytes((i + 0xc8) & 0xff for i in range(256)))),
+    '[long': ((-0x08, 0x0f, 1, bytes((i + 0xe0) & 0xff for i in range(256))),
+              (-0x800, 0x7ff, 2, bytes((i + 0xf8) & 0xff for i in range(256)))),
+}
+# 二进制数据分块的最大长度
+BINARY_CHUNK_SIZE = 0x8000
+# 不小于此长度的二进制数据在发送时不复制到请求的缓冲区
+BINARY_ZERO_COPY_SIZE = 0x10000
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MILLISECOND = timedelta(milliseconds=1)
+# BMP以外的字符，在Java中占用两个char
+_SUPPLEMENTARY_CHAR = re.compile('[\U00010000-\U0010ffff]')
 
 
 class JavaObject(object):
@@ -60,10 +167,439 @@ class JavaObject(object):
     def keys(self):
         return list(self.__values.keys())
 
+    def get_values(self):
+        return self.__values
+
     def get_path(self):
         return self.__path
 
 
+class JavaClass(object):
+    """
+    Java类的结构：类路径、有序的字段名以及可选的字段类型
+    通过register_class注册后，同一路径的JavaObject会使用预先确定好的字段顺序和编码方法进行编码
+    """
+
+    def __init__(self, path, fields, types=None):
+        """
+        :param path:   Java类的路径，例如：com.example.UserDTO
+        :param fields: 有序的字段名
+        :param types:  字段类型，{字段名: 类型}，类型可以为boolean、int、long、double、float、string，
+                       未指定类型的字段在编码时根据值自动判断
+        """
+        if not isinstance(path, str):
+            raise ValueError('Class path {} should be string type.'.format(path))
+        self.path = path
+        self.fields = tuple(fields)
+        self.types = dict(types or {})
+        for field_name in self.types:
+            if field_name not in self.fields:
+                raise DataError('Unknown field {} in class {}'.format(field_name, path))
+        self.key = (path, self.fields)  # 在请求中区分不同的类定义
+        self.field_set = frozenset(self.fields)
+        # 专用的编码方法，在_compile_class中生成
+        self.encode = None
+        self.encode_records = None
+        self.encode_columns = None
+        self.definition = None  # 类定义编码后的字节，第一次编码时生成
+
+    def __repr__(self):
+        return '<java class {} with {}>'.format(self.path, self.fields)
+
+
+_class_schemas = {}  # 类路径 -> JavaClass
+
+
+def _compile_class(schema):
+    """
+    为类结构生成专用的编码方法：
+    encode：编码一个对象的所有字段
+    encode_records：循环编码多行字典形式的数据
+    encode_columns：循环编码按列存储的数据
+    :param schema: JavaClass
+    :return: JavaClass
+    """
+    fields = []
+    for i, field_name in enumerate(schema.fields):
+        _type = schema.types.get(field_name)
+        if _type not in _FIELD_ENCODERS:
+            raise DataError('Unknown field type {} of {}.{}'.format(_type, schema.path, field_name))
+        fields.append((i, field_name, _FIELD_ENCODERS[_type]))
+
+    lines = ['def encode(request, buffer, values):',
+             '    append = buffer.append',
+             '    get = values.get']
+    for i, field_name, template in fields:
+        lines.append('    v = get({!r})'.format(field_name))
+        lines.extend('    ' + line for line in template)
+
+    lines += ['def encode_records(request, buffer, head, mark, records):',
+              '    append = buffer.append',
+              '    for values in records:',
+              '        if not values.keys() <= field_set: raise_unknown_fields(schema, values)',
+              '        mark(None)',
+              '        buffer += head',
+              '        get = values.get']
+    for i, field_name, template in fields:
+        lines.append('        v = get({!r})'.format(field_name))
+        lines.extend('        ' + line for line in template)
+
+    lines += ['def encode_columns(request, buffer, head, mark, columns):',
+              '    append = buffer.append',
+              '    for {} in zip(*columns):'.format(''.join('v%d, ' % i for i, _, _ in fields) or '_'),
+              '        mark(None)',
+              '        buffer += head']
+    for i, field_name, template in fields:
+        lines.append('        v = v%d' % i)
+        lines.extend('        ' + line for line in template)
+
+    namespace = {
+        'encode_value': Request._encode_single_value,
+        'encode_int': Request._encode_int,
+        'encode_long': Request._encode_long,
+        'encode_float': Request._encode_float,
+        'encode_str': Request._encode_str,
+        'schema': schema,
+        'field_set': schema.field_set,
+        'raise_unknown_fields': _raise_unknown_fields,
+    }
+    exec('\n'.join(lines), namespace)
+    schema.encode = namespace['encode']
+    schema.encode_records = namespace['encode_records']
+    schema.encode_columns = namespace['encode_columns']
+    return schema
+
+
+def _find_invalid_field(schema, rows, records):
+    """
+    找出第一个值与字段类型不符的字段，只在生成的编码方法出错时调用
+    :param schema: JavaClass
+    :param rows: 多行数据
+    :param records: rows中的每一行是否为字典，否则为按照字段顺序排列的值
+    :return: 描述字段和值的字符串，没有找到时返回None
+    """
+    checks = [(i, field_name, _FIELD_VALUE_TYPES[schema.types[field_name]])
+              for i, field_name in enumerate(schema.fields) if schema.types.get(field_name) in _FIELD_VALUE_TYPES]
+    for row, values in enumerate(rows):
+        if records and not isinstance(values, dict):
+            return 'row {} should be dict, got {!r}'.format(row, values)
+        for i, field_name, value_type in checks:
+            v = values.get(field_name) if records else values[i]
+            # bool是int的子类，但是不能作为int、long写入
+            if v is not None and (not isinstance(v, value_type) or value_type is int and v.__class__ is bool):
+                return 'field {} of type {} got {!r} at row {}'.format(field_name, schema.types[field_name], v, row)
+    return None
+
+
+def _raise_unknown_fields(schema, values):
+    """
+    对象中有类结构以外的字段时抛出DataError，这些字段不能按照类结构编码，不能静默丢弃
+    :param schema: JavaClass
+    :param values: {字段名: 值}
+    :return:
+    """
+    unknown = [str(field_name) for field_name in values if field_name not in schema.field_set]
+    raise DataError('Unknown field {} in class {}'.format(', '.join(unknown), schema.path))
+
+
+def _raise_encode_error(schema, rows, records, error):
+    """
+    把生成的编码方法中因为值的类型不符而出现的异常转换为DataError，说明出错的类和字段
+    :param schema: JavaClass
+    :param rows: 多行数据，见_find_invalid_field
+    :param records: rows中的每一行是否为字典
+    :param error: 原始异常
+    :return:
+    """
+    field = _find_invalid_field(schema, rows, records)
+    raise DataError('Invalid value for class {}: {}'.format(schema.path, field or error)) from error
+
+
+def register_class(path, fields, types=None):
+    """
+    注册一个Java类的结构，为其生成专用的编码方法：
+    按照字段顺序逐个写入字段值，已知类型的字段直接调用对应的编码方法，不再逐个判断值的类型
+    :param path:   Java类的路径
+    :param fields: 有序的字段名
+    :param types:  字段类型，{字段名: 类型}
+    :return: JavaClass
+    """
+    schema = _compile_class(JavaClass(path, fields, types))
+    _class_schemas[path] = schema
+    return schema
+
+
+def unregister_class(path):
+    """
+    删除一个已注册的Java类的结构
+    :param path: Java类的路径
+    :return:
+    """
+    _class_schemas.pop(path, None)
+
+
+class JavaObjectBatch(object):
+    """
+    一批同一个Java类的对象，编码为List<path>，可以由多行字典或者按列存储的数据创建，
+    编码时只写入一次类定义，每一行的字段按照类结构直接写入，不需要为每一行创建JavaObject
+    """
+
+    def __init__(self, path, records=None, columns=None, fields=None, types=None):
+        """
+        :param path:    Java类的路径，例如：com.example.UserDTO
+        :param records: 多行数据，[{字段名: 值}, ...]，每一行不能有fields以外的字段
+        :param columns: 按列存储的数据，{字段名: 列}或者pandas.DataFrame，列可以为list、array.array、numpy数组、pandas.Series
+        :param fields:  有序的字段名，默认使用register_class注册的类结构，没有注册时使用列名或者第一行数据的键
+        :param types:   字段类型，{字段名: 类型}，同register_class，numpy数组的列在没有指定类型时根据dtype确定
+        """
+        if (records is None) == (columns is None):
+            raise DataError('Exactly one of records and columns should be given')
+        if not isinstance(path, str):
+            raise ValueError('Object path {} should be string type.'.format(path))
+        self.path = path
+        self.records = records
+        self.columns = None
+
+        schema = _class_schemas.get(path)
+        if fields is None and schema is not None:
+            fields = schema.fields
+            types = dict(schema.types, **(types or {}))
+        elif fields is None:
+            if columns is not None:
+                fields = list(columns.keys())
+            else:
+                fields = list(records[0].keys()) if len(records) else []
+        types = dict(types or {})
+
+        if columns is not None:
+            self.columns = []
+            self.__length = None
+            for field_name in fields:
+                column = columns[field_name] if field_name in columns else None
+                if column is None:
+                    self.columns.append(repeat(None))
+                    continue
+                if field_name not in types and getattr(column, 'dtype', None) is not None:
+                    _type = _DTYPE_FIELD_TYPES.get(column.dtype.kind)
+                    if _type is not None:
+                        types[field_name] = _type
+                if hasattr(column, 'tolist'):  # numpy数组、pandas.Series整体转换为python对象
+                    column = column.tolist()
+                if self.__length is None:
+                    self.__length = len(column)
+                elif len(column) != self.__length:
+                    raise DataError('All columns should have the same length')
+                self.columns.append(column)
+            if self.__length is None:
+                self.__length = 0
+        else:
+            self.__length = len(records)
+
+        if schema is None or schema.fields != tuple(fields) or schema.types != types:
+            schema = _get_batch_schema(path, fields, types)
+        self.schema = schema
+
+    def __len__(self):
+        return self.__length
+
+    def __repr__(self):
+        return '<java object batch {} with {} rows>'.format(self.path, self.__length)
+
+
+_batch_schemas = {}  # (类路径, 字段, 字段类型) -> 为JavaObjectBatch生成的JavaClass
+
+
+def _get_batch_schema(path, fields, types):
+    """
+    获取JavaObjectBatch使用的类结构，相同的结构只生成一次编码方法
+    :param path:
+    :param fields:
+    :param types:
+    :return: JavaClass
+    """
+    key = (path, tuple(fields), tuple(sorted(types.items())))
+    schema = _batch_schemas.get(key)
+    if schema is None:
+        schema = _batch_schemas[key] = _compile_class(JavaClass(path, fields, types))
+    return schema
+
+
+class StringCache(object):
+    """
+    按照字节数限制大小的LRU缓存，保存字符串编码后的字节，在所有的Request之间共享
+    """
+
+    def __init__(self, max_bytes, max_length):
+        """
+        :param max_bytes:  缓存的编码结果的总字节数上限
+        :param max_length: 只缓存长度不超过此值的字符串
+        """
+        self.max_bytes = max_bytes
+        self.max_length = max_length
+        self.size = 0  # 当前缓存的编码结果的总字节数
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__items = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, value):
+        """
+        获取字符串编码后的字节，命中时将其移动到最近使用的位置
+        与put使用同一个锁，编码器在多个线程中同时使用时命中次数的统计仍然准确
+        :param value:
+        :return: 没有缓存时返回None
+        """
+        with self.__lock:
+            data = self.__items.get(value)
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.__items.move_to_end(value)
+            return data
+
+    def put(self, value, data):
+        """
+        缓存字符串编码后的字节，超过上限时淘汰最久未使用的字符串
+        :param value:
+        :param data:
+        :return:
+        """
+        if len(data) > self.max_bytes:
+            return
+        with self.__lock:
+            if value in self.__items:
+                return
+            self.__items[value] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self.__items.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self.__lock:
+            self.__items.clear()
+            self.size = 0
+
+    def stats(self):
+        """
+        缓存的使用情况，用于调整缓存的大小
+        :return:
+        """
+        with self.__lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'count': len(self.__items),
+                'size': self.size,
+                'max_bytes': self.max_bytes,
+            }
+
+
+_string_cache = None  # 为None时不使用字符串缓存
+
+
+def enable_string_cache(max_bytes=1024 * 1024, max_length=256):
+    """
+    开启字符串编码结果的缓存，适用于Map的键、类路径、字段名、枚举值等在请求中大量重复出现的字符串
+    :param max_bytes:  缓存的编码结果的总字节数上限
+    :param max_length: 只缓存长度不超过此值的字符串
+    :return: StringCache，可以通过其stats方法获取命中情况
+    """
+    global _string_cache
+    _string_cache = StringCache(max_bytes, max_length)
+    return _string_cache
+
+
+def disable_string_cache():
+    """
+    关闭字符串编码结果的缓存
+    :return:
+    """
+    global _string_cache
+    _string_cache = None
+
+
+def get_string_cache():
+    """
+    获取当前的字符串缓存
+    :return: 没有开启时返回None
+    """
+    return _string_cache
+
+
+def _pack_array(value, tag, typecode):
+    """
+    把array.array打包为大端序的定长元素，并在每个元素前插入类型标记
+    :param value: array.array
+    :param tag: 元素的类型标记
+    :param typecode: 元素对应的array.array的typecode
+    :return:
+    """
+    if value.typecode != typecode or sys.byteorder == 'little':
+        value = array(typecode, value)
+        if sys.byteorder == 'little':
+            value.byteswap()
+    data = value.tobytes()
+    width = value.itemsize
+    step = width + 1
+    result = bytearray(step * len(value))
+    result[0::step] = tag * len(value)
+    for i in range(width):
+        result[i + 1::step] = data[i::width]
+    return result
+
+
+def _get_compact_width(_type, low, high):
+    """
+    根据整数数组中最小、最大的元素确定紧凑编码的方式
+    :param _type: hessian列表类型
+    :param low: 最小的元素
+    :param high: 最大的元素
+    :return: (每个元素的字节数, 转换首字节的表)，不能使用紧凑编码时返回None
+    """
+    if high > MAX_INT_64:
+        raise DataError('Value {} is out of range of {}'.format(high, _type[1:]))
+    for low_limit, high_limit, width, table in _COMPACT_ELEMENTS.get(_type, ()):
+        if low_limit <= low and high <= high_limit:
+            return width, table
+    return None
+
+
+def _pack_compact(data, width, table):
+    """
+    把大端序的有符号整数转换为紧凑编码：单字节的整数整块查表转换，双字节的整数只转换首字节
+    :param data: 每个元素width个字节
+    :param width: 1或者2
+    :param table: 把有符号字节转换为首字节的表
+    :return:
+    """
+    if width == 1:
+        return data.translate(table)
+    result = bytearray(data)
+    result[0::2] = result[0::2].translate(table)
+    return result
+
+
+def _split_surrogate_pairs(value):
+    """
+    把BMP以外的字符拆分为UTF-16代理对，使字符串的长度与Java中的char数量一致
+    :param value:
+    :return:
+    """
+
+    def split(match):
+        code = ord(match.group()) - 0x10000
+        return chr(0xd800 + (code >> 10)) + chr(0xdc00 + (code & 0x3ff))
+
+    return _SUPPLEMENTARY_CHAR.sub(split, value)
+
+
 class Request(object):
     """
     A class for dumping dubbo request body.
@@ -74,82 +610,98 @@ class Request(object):
     * double
     * string
     * object
+
+    所有的编码方法都直接写入同一个可增长的bytearray中，头部的16个字节预先保留，
+    在请求体编码完成后使用struct.pack_into原地回填调用ID和请求体长度
     """
 
     def __init__(self, request):
         self.__body = request
-        self.__classes = []
+        self.__classes = {}  # 类路径 -> 类编号
+        self.__refs = {}  # id(已编码的对象/列表/字典) -> 引用编号
+        self.__referenced = []  # 已编码的对象，保证编码过程中对象不会被回收导致id被复用
+        self.__buffer = bytearray()
+        self.__external = []  # [(在缓冲区中的位置, 不复制的二进制数据), ...]
         self.types = []  # 泛型
         self.invoke_id = get_invoke_id()
 
-    def encode(self):
+    def encode(self, compiled=None):
         """
         把请求序列化为字节数组
+        :param compiled: 由compile得到的(前缀, 后缀)，传入时只需要对参数进行编码
         :return:
         """
-        request_body = self._encode_request_body()
-        invoke_id = list(bytearray(struct.pack('!q', self.invoke_id)))
-        request_head = DEFAULT_REQUEST_META + invoke_id + get_request_body_length(request_body)
-        return bytearray(request_head + request_body)
+        segments = self.encode_segments(compiled)
+        if len(segments) == 1:
+            return segments[0]
+        return bytearray(b''.join(segments))
 
-    def _get_parameter_types(self, arguments):
+    def encode_segments(self, compiled=None):
         """
-        针对所有的参数计算得到参数类型字符串
-        :param arguments:
-        :return:
+        把请求序列化为多个分段，较大的二进制参数不会被复制到请求的缓冲区中，而是作为单独的分段引用原始数据，
+        可以直接通过Connection.write_segments发送
+        :param compiled: 由compile得到的(前缀, 后缀)，传入时只需要对参数进行编码
+        :return: [bytearray/memoryview, ...]
         """
-        parameter_types = ''
-        # 判断并得出参数的类型
-        for argument in arguments:
-            parameter_types += self._get_class_name(argument)
-        return parameter_types
+        if compiled is None:
+            compiled = self.compile()
+        prefix, suffix = compiled
+        self.__buffer = buffer = bytearray(prefix)
+        self.__external = external = []
+        for argument in self.__body['arguments']:
+            self._encode_single_value(argument)
+        buffer += suffix
+        # 回填调用ID和请求体长度
+        external_length = sum(len(data) for _, data in external)
+        struct.pack_into('!qi', buffer, 4, self.invoke_id, len(buffer) + external_length - HEAD_LENGTH)
+        if not external:
+            return [buffer]
 
-    def _get_class_name(self, _class):
+        # 在记录的位置把缓冲区切开，插入外部的二进制数据
+        segments = []
+        view = memoryview(buffer)
+        start = 0
+        for position, data in external:
+            if position > start:
+                segments.append(view[start:position])
+            segments.append(data)
+            start = position
+        if start < len(buffer):
+            segments.append(view[start:])
+        return segments
+
+    def get_parameter_types(self):
         """
-        根据一个字段的类型得到其在Java中对应类的全限定名
-        转换规则：https://stackoverflow.com/a/3442100/4614538
-        :param _class:
+        获取本次请求的参数类型描述，例如：Ljava/lang/String;J
         :return:
         """
-        if isinstance(_class, bool):  # bool类型的判断必须放在int类型判断的前面
-            return 'Z'
-        elif isinstance(_class, int):
-            return 'J'
-        elif isinstance(_class, float):
-            return 'D'
-        elif isinstance(_class, str):
-            return 'L' + 'java/lang/String' + ';'
-        elif isinstance(_class, JavaObject):
-            path = _class.get_path()
-            path = 'L' + path.replace('.', '/') + ';'
-            return path
-        elif isinstance(_class, list):
-            if len(_class) == 0:
-                raise DataError('Method parameter {} is a list but length is zero'.format(_class))
-            return '[' + self._get_class_name(_class[0])
-        else:
-            raise DataError('Unknown argument type: {0}'.format(_class))
+        return self._get_parameter_types(self.__body['arguments'])
 
-    def _encode_request_body(self):
+    def compile(self, parameter_types=None):
         """
-        对所有的已知的参数根据dubbo协议进行编码
-        :return:
+        对请求中与参数值无关的部分进行编码，同一个方法的多次调用之间这部分内容不会变化，可以缓存复用
+        前缀：预留的头部 + dubbo_version + 接口 + 版本 + 方法名 + 参数类型
+        后缀：attachments
+        :param parameter_types: 参数类型描述，不传入时根据参数计算
+        :return: (前缀, 后缀)
         """
         dubbo_version = self.__body['dubbo_version']
         path = self.__body['path']
         version = self.__body['version']
         method = self.__body['method']
-        arguments = self.__body['arguments']
         group = self.__body['group']
+        if parameter_types is None:
+            parameter_types = self.get_parameter_types()
 
-        body = []
-        body.extend(self._encode_single_value(dubbo_version))
-        body.extend(self._encode_single_value(path))
-        body.extend(self._encode_single_value(version))
-        body.extend(self._encode_single_value(method))
-        body.extend(self._encode_single_value(self._get_parameter_types(arguments)))
-        for argument in arguments:
-            body.extend(self._encode_single_value(argument))
+        self.__buffer = prefix = bytearray(HEAD_LENGTH)
+        prefix[:4] = DEFAULT_REQUEST_META
+        self._encode_single_value(dubbo_version)
+        self._encode_single_value(path)
+        self._encode_single_value(version)
+        self._encode_single_value(method)
+        self._encode_single_value(parameter_types)
+
+        self.__buffer = suffix = bytearray()
         attachments = {
             'path': path,
             'interface': path,
@@ -157,156 +709,280 @@ class Request(object):
             'group': group
         }
         # attachments参数以H开头，以Z结尾
-        body.append(ord('H'))
+        suffix.append(ord('H'))
         for key in list(attachments.keys()):
             value = attachments[key]
-            body.extend(self._encode_single_value(key))
-            body.extend(self._encode_single_value(value))
-        body.append(ord('Z'))
+            self._encode_single_value(key)
+            self._encode_single_value(value)
+        suffix.append(ord('Z'))
+        return bytes(prefix), bytes(suffix)
 
-        # 因为在上面的逻辑中没有对byte大小进行检测，所以在这里进行统一的处理
-        for i in range(len(body)):
-            body[i] = body[i] & 0xff
-        return body
+    def _get_parameter_types(self, arguments):
+        """
+        针对所有的参数计算得到参数类型字符串
+        :param arguments:
+        :return:
+        """
+        parameter_types = ''
+        # 判断并得出参数的类型
+        for argument in arguments:
+            parameter_types += self._get_class_name(argument)
+        return parameter_types
 
-    @staticmethod
-    def _encode_bool(value):
+    def _get_class_name(self, _class):
+        """
+        根据一个字段的类型得到其在Java中对应类的全限定名
+        转换规则：https://stackoverflow.com/a/3442100/4614538
+        :param _class:
+        :return:
+        """
+        signature = _get_type_entry(_class)[1]
+        if callable(signature):
+            return signature(self, _class)
+        return signature
+
+    def _get_object_class_name(self, value):
+        """
+        JavaObject的类型描述，例如：Lcom/example/UserDTO;
+        :param value:
+        :return:
+        """
+        return 'L' + value.get_path().replace('.', '/') + ';'
+
+    def _get_list_class_name(self, value):
+        """
+        列表的类型描述，由第一个元素的类型决定，例如：[Ljava/lang/String;
+        :param value:
+        :return:
+        """
+        if len(value) == 0:
+            raise DataError('Method parameter {} is a list but length is zero'.format(value))
+        return '[' + self._get_class_name(value[0])
+
+    def _get_batch_class_name(self, value):
+        """
+        JavaObjectBatch的类型描述，与JavaObject组成的列表一致，例如：[Lcom/example/UserDTO;
+        :param value:
+        :return:
+        """
+        return '[L' + value.path.replace('.', '/') + ';'
+
+    def _get_array_class_name(self, value):
+        """
+        array.array的类型描述，例如：[I
+        :param value:
+        :return:
+        """
+        return _PACKED_ELEMENTS[self._get_array_type(value)][3]
+
+    def _get_ndarray_class_name(self, value):
+        """
+        numpy数组的类型描述，例如：[D
+        :param value:
+        :return:
+        """
+        _type = self._get_ndarray_type(value)
+        return '[Z' if _type == '[boolean' else _PACKED_ELEMENTS[_type][3]
+
+    def write(self, data):
+        """
+        把已经编码好的字节直接写入请求，用于自定义的编码方法
+        :param data:
+        :return:
+        """
+        self.__buffer += data
+
+    def encode_value(self, value):
+        """
+        对任意支持的值进行编码，用于自定义的编码方法
+        :param value:
+        :return:
+        """
+        self._encode_single_value(value)
+
+    def _encode_null(self, value):
+        """
+        对None进行编码
+        :param value:
+        :return:
+        """
+        self.__buffer.append(ord('N'))
+
+    def _encode_bool(self, value):
         """
         对bool类型进行编码
         :param value:
         :return:
         """
-        result = []
         if value:
-            result.append(ord('T'))
+            self.__buffer.append(ord('T'))
         else:
-            result.append(ord('F'))
-        return result
+            self.__buffer.append(ord('F'))
 
-    @staticmethod
-    def _encode_int(value):
+    def _encode_int(self, value):
         """
         对整数进行编码
         :param value:
         :return:
         """
-        result = []
+        buffer = self.__buffer
         # 超出int类型范围的值则转化为long类型
         # 这里问题在于对于落在int范围内的数字，我们无法判断其是long类型还是int类型，所以一律认为其是int类型
         if value > MAX_INT_32 or value < MIN_INT_32:
-            result.append(ord('L'))
-            result.extend(list(bytearray(struct.pack('!q', value))))
-            return result
+            buffer += struct.pack('!cq', b'L', value)
+            return
 
         if -0x10 <= value <= 0x2f:
-            result.append(value + 0x90)
+            buffer.append(value + 0x90)
         elif -0x800 <= value <= 0x7ff:
-            result.append(0xc8 + (value >> 8))
-            result.append(value)
+            buffer.append(0xc8 + (value >> 8))
+            buffer.append(value & 0xff)
         elif -0x40000 <= value <= 0x3ffff:
-            result.append(0xd4 + (value >> 16))
-            result.append(value >> 8)
-            result.append(value)
+            buffer.append(0xd4 + (value >> 16))
+            buffer += struct.pack('!H', value & 0xffff)
         else:
-            result.append(ord('I'))
-            result.append(value >> 24)
-            result.append(value >> 16)
-            result.append(value >> 8)
-            result.append(value)
-        return result
+            buffer += struct.pack('!ci', b'I', value)
 
-    @staticmethod
-    def _encode_float(value):
+    def _encode_long(self, value):
+        """
+        对长整型进行编码，用于已知字段类型为long的场景
+        :param value:
+        :return:
+        """
+        buffer = self.__buffer
+        if -0x08 <= value <= 0x0f:
+            buffer.append(value + 0xe0)
+        elif -0x800 <= value <= 0x7ff:
+            buffer.append(0xf8 + (value >> 8))
+            buffer.append(value & 0xff)
+        elif -0x40000 <= value <= 0x3ffff:
+            buffer.append(0x3c + (value >> 16))
+            buffer += struct.pack('!H', value & 0xffff)
+        elif MIN_INT_32 <= value <= MAX_INT_32:
+            buffer += struct.pack('!Bi', 0x59, value)
+        else:
+            buffer += struct.pack('!cq', b'L', value)
+
+    def _encode_float(self, value):
         """
         对浮点类型进行编码
         :param value:
         :return:
         """
-        result = []
+        buffer = self.__buffer
+        if not math.isfinite(value):  # NaN和无穷大只能使用完整的double格式
+            buffer += struct.pack('!cd', b'D', value)
+            return
         int_value = int(value)
         if int_value == value:
             if int_value == 0:
-                result.append(0x5b)
-                return result
+                buffer.append(0x5b)
+                return
             elif int_value == 1:
-                result.append(0x5c)
-                return result
+                buffer.append(0x5c)
+                return
             elif -0x80 <= int_value < 0x80:
-                result.append(0x5d)
-                result.append(int_value)
-                return result
+                buffer += struct.pack('!Bb', 0x5d, int_value)
+                return
             elif -0x8000 <= int_value < 0x8000:
-                result.append(0x5e)
-                result.append(int_value >> 8)
-                result.append(int_value)
-                return result
+                buffer += struct.pack('!Bh', 0x5e, int_value)
+                return
 
         mills = int(value * 1000)
         if 0.001 * mills == value and MIN_INT_32 <= mills <= MAX_INT_32:
-            result.append(0x5f)
-            result.append(mills >> 24)
-            result.append(mills >> 16)
-            result.append(mills >> 8)
-            result.append(mills)
-            return result
-
-        bits = double_to_long_bits(value)
-        result.append(ord('D'))
-        result.append(bits >> 56)
-        result.append(bits >> 48)
-        result.append(bits >> 40)
-        result.append(bits >> 32)
-        result.append(bits >> 24)
-        result.append(bits >> 16)
-        result.append(bits >> 8)
-        result.append(bits)
-        return result
+            buffer += struct.pack('!Bi', 0x5f, mills)
+            return
 
-    @staticmethod
-    def _encode_utf(value):
+        buffer += struct.pack('!cd', b'D', value)
+
+    def _encode_str(self, value):
         """
-        对字符串进行编码，编码格式utf-8
-        参见方法：com.alibaba.com.caucho.hessian.io.Hessian2Output#printString
+        对一个字符串进行编码，开启了字符串缓存时较短的字符串优先从缓存中获取编码结果，参见enable_string_cache
         :param value:
         :return:
         """
-        result = []
-        for v in value:
-            ch = ord(v)
-            if ch < 0x80:
-                result.append(ch & 0xff)
-            elif ch < 0x800:
-                result.append((0xc0 + ((ch >> 6) & 0x1f)) & 0xff)
-                result.append((0x80 + (ch & 0x3f)) & 0xff)
-            else:
-                result.append((0xe0 + ((ch >> 12) & 0xf)) & 0xff)
-                result.append((0x80 + ((ch >> 6) & 0x3f)) & 0xff)
-                result.append((0x80 + (ch & 0x3f)) & 0xff)
-        return result
+        cache = _string_cache
+        if cache is None or len(value) > cache.max_length:
+            return self._write_str(value)
+        data = cache.get(value)
+        if data is not None:
+            self.__buffer += data
+            return
+        start = len(self.__buffer)
+        self._write_str(value)
+        cache.put(value, bytes(self.__buffer[start:]))
 
-    def _encode_str(self, value):
+    def _write_str(self, value):
         """
-        对一个字符串进行编码
+        对一个字符串进行编码，超过0x8000个字符的字符串按照hessian协议拆分为多个'R'分块
         :param value:
         :return:
         """
-        result = []
+        buffer = self.__buffer
         # 在进行网络传输操作时一律使用unicode进行操作
-        # if isinstance(value, str):
-        #     value = value.decode('utf-8')
+        if value.isascii():
+            # ASCII字符串的字符下标和字节下标一一对应，只需要整体编码一次
+            data = memoryview(value.encode('ascii'))
+        else:
+            if _SUPPLEMENTARY_CHAR.search(value) is not None:
+                value = _split_surrogate_pairs(value)
+            data = None
         length = len(value)
+
+        offset = 0
+        while length - offset > STRING_CHUNK_SIZE:
+            end = offset + STRING_CHUNK_SIZE
+            if 0xd800 <= ord(value[end - 1]) <= 0xdbff:  # 分块时不能拆开代理对
+                end -= 1
+            buffer += struct.pack('!cH', b'R', end - offset)
+            if data is not None:
+                buffer += data[offset:end]
+            else:
+                buffer += value[offset:end].encode('utf-8', 'surrogatepass')
+            offset = end
+        length -= offset
+
         if length <= 0x1f:
-            result.append(0x00 + length)
+            buffer.append(0x00 + length)
         elif length <= 0x3ff:
-            result.append(0x30 + (length >> 8))
-            result.append(length)
+            buffer.append(0x30 + (length >> 8))
+            buffer.append(length & 0xff)
         else:
-            result.append(ord('S'))
-            result.append(length >> 8)
-            result.append(length)
+            buffer += struct.pack('!cH', b'S', length)
 
-        result.extend(self._encode_utf(value))
-        return result
+        if data is not None:
+            buffer += data[offset:]
+        else:
+            buffer += value[offset:].encode('utf-8', 'surrogatepass')
+
+    def _encode_ref(self, value):
+        """
+        对象、列表、字典在同一个请求中按照编码的顺序依次编号，与解码时的Response.objects一一对应
+        同一个实例再次出现时只写入其引用(0x51 + 编号)，这样也可以正确的编码循环引用
+        :param value:
+        :return: 写入了引用时返回True，否则为其分配编号并返回False
+        """
+        refs = self.__refs
+        ref = refs.get(id(value))
+        if ref is not None:
+            self.__buffer.append(0x51)
+            self._encode_int(ref)
+            return True
+        refs[id(value)] = len(self.__referenced)
+        self.__referenced.append(value)
+        return False
+
+    def _encode_class_id(self, class_id):
+        """
+        对对象所属类的编号进行编码
+        :param class_id:
+        :return:
+        """
+        if class_id <= 0xf:
+            self.__buffer.append(class_id + 0x60)
+        else:
+            self.__buffer.append(ord('O'))
+            self._encode_int(class_id)
 
     def _encode_object(self, value):
         """
@@ -314,30 +990,194 @@ class Request(object):
         :param value:
         :return:
         """
-        result = []
+        if self._encode_ref(value):
+            return
         path = value.get_path()
+        schema = _class_schemas.get(path)
+        if schema is not None:
+            return self._encode_schema_object(schema, value)
+
+        buffer = self.__buffer
         field_names = list(value.keys())
 
-        if path not in self.__classes:
-            result.append(ord('C'))
-            result.extend(self._encode_single_value(path))
+        class_id = self.__classes.get(path)
+        if class_id is None:
+            buffer.append(ord('C'))
+            self._encode_single_value(path)
 
-            result.extend(self._encode_single_value(len(field_names)))
+            self._encode_single_value(len(field_names))
 
             for field_name in field_names:
-                result.extend(self._encode_single_value(field_name))
-            self.__classes.append(path)
-        class_id = self.__classes.index(path)
-        if class_id <= 0xf:
-            class_id += 0x60
-            class_id &= 0xff
-            result.append(class_id)
-        else:
-            result.append(ord('O'))
-            result.extend(self._encode_single_value(class_id))
+                self._encode_single_value(field_name)
+            class_id = self.__classes[path] = len(self.__classes)
+        self._encode_class_id(class_id)
         for field_name in field_names:
-            result.extend(self._encode_single_value(value[field_name]))
-        return result
+            self._encode_single_value(value[field_name])
+
+    def _encode_class_definition(self, schema):
+        """
+        在请求中第一次出现某个类结构时写入其类定义，返回类编号
+        :param schema: JavaClass
+        :return:
+        """
+        buffer = self.__buffer
+        class_id = self.__classes.get(schema.key)
+        if class_id is None:
+            if schema.definition is None:
+                start = len(buffer)
+                buffer.append(ord('C'))
+                self._encode_str(schema.path)
+                self._encode_int(len(schema.fields))
+                for field_name in schema.fields:
+                    self._encode_str(field_name)
+                schema.definition = bytes(buffer[start:])
+            else:
+                buffer += schema.definition
+            class_id = self.__classes[schema.key] = len(self.__classes)
+        return class_id
+
+    def _encode_schema_object(self, schema, value):
+        """
+        使用注册过的类结构对一个对象进行编码，字段的顺序和编码方法在注册时就已经确定
+        对象中有类结构以外的字段时抛出DataError
+        :param schema: JavaClass
+        :param value: JavaObject
+        :return:
+        """
+        values = value.get_values()
+        if not values.keys() <= schema.field_set:
+            _raise_unknown_fields(schema, values)
+        self._encode_class_id(self._encode_class_definition(schema))
+        try:
+            schema.encode(self, self.__buffer, values)
+        except (TypeError, AttributeError, struct.error) as e:
+            _raise_encode_error(schema, [values], True, e)
+
+    def _encode_batch(self, value):
+        """
+        对一批同一个类的对象进行编码：只写入一次类定义，之后在生成的循环中直接写入每一行的字段，
+        不需要为每一行创建JavaObject
+        :param value: JavaObjectBatch
+        :return:
+        """
+        length = len(value)
+        if length == 0:
+            return self._encode_single_value(None)
+        if self._encode_ref(value):
+            return
+        buffer = self.__buffer
+        schema = value.schema
+        self._encode_list_head('[object', length)
+        class_id = self._encode_class_definition(schema)
+        # 每一行对象开头的类编号都相同，只需要编码一次
+        start = len(buffer)
+        self._encode_class_id(class_id)
+        head = bytes(buffer[start:])
+        del buffer[start:]
+        # 每一行对象在引用表中都占用一个编号，但是不会被再次引用，所以只占位
+        mark = self.__referenced.append
+        try:
+            if value.columns is not None:
+                schema.encode_columns(self, buffer, head, mark, value.columns)
+            else:
+                schema.encode_records(self, buffer, head, mark, value.records)
+        except (TypeError, AttributeError, struct.error) as e:
+            if value.columns is not None:
+                _raise_encode_error(schema, zip(*value.columns), False, e)
+            _raise_encode_error(schema, value.records, True, e)
+
+    def _encode_list_head(self, _type, length):
+        """
+        对定长的有类型列表的头部进行编码：列表标记、类型、长度
+        :param _type: 列表类型，例如：[int
+        :param length: 列表长度
+        :return:
+        """
+        if length < 0x7:
+            self.__buffer.append(0x70 + length)
+        else:
+            self.__buffer.append(0x56)
+        if _type not in self.types:
+            self.types.append(_type)
+            self._encode_str(_type)
+        else:
+            self._encode_int(self.types.index(_type))
+        if length >= 0x7:
+            self._encode_int(length)
+
+    @staticmethod
+    def _get_array_type(value):
+        """
+        根据array.array的typecode获取对应的hessian列表类型
+        :param value:
+        :return:
+        """
+        _type = _ARRAY_TYPES.get(value.typecode)
+        if _type is None:
+            raise DataError('Unsupported array typecode: {}'.format(value.typecode))
+        return _type
+
+    @staticmethod
+    def _get_ndarray_type(value):
+        """
+        根据numpy数组的dtype获取对应的hessian列表类型，只支持一维数组
+        :param value:
+        :return:
+        """
+        if value.ndim != 1:
+            raise DataError('Only 1-D numpy array is supported, got {}-D'.format(value.ndim))
+        _type = _NUMPY_TYPES.get('%s%d' % (value.dtype.kind, value.dtype.itemsize))
+        if _type is None:
+            raise DataError('Unsupported numpy dtype: {}'.format(value.dtype))
+        return _type
+
+    def _encode_array(self, value):
+        """
+        把array.array整块编码为有类型的列表，例如：[int、[long、[double
+        整数的元素都在单字节或者双字节整数的范围内时使用紧凑编码，否则每个元素使用定长编码，见_PACKED_ELEMENTS
+        :param value:
+        :return:
+        """
+        if self._encode_ref(value):
+            return
+        _type = self._get_array_type(value)
+        tag, typecode, _, _ = _PACKED_ELEMENTS[_type]
+        compact = _get_compact_width(_type, min(value), max(value)) if _type in _COMPACT_ELEMENTS and value else None
+        self._encode_list_head(_type, len(value))
+        if compact is not None:
+            width, table = compact
+            data = array('b' if width == 1 else 'h', value)
+            if width == 2 and sys.byteorder == 'little':
+                data.byteswap()
+            self.__buffer += _pack_compact(data.tobytes(), width, table)
+            return
+        self.__buffer += _pack_array(value, tag, typecode)
+
+    def _encode_ndarray(self, value):
+        """
+        把一维的numpy数组整块编码为有类型的列表，元素的编码方式同_encode_array
+        :param value:
+        :return:
+        """
+        if self._encode_ref(value):
+            return
+        _type = self._get_ndarray_type(value)
+        compact = None
+        if _type in _COMPACT_ELEMENTS and len(value):
+            compact = _get_compact_width(_type, int(value.min()), int(value.max()))
+        self._encode_list_head(_type, len(value))
+        if _type == '[boolean':
+            self.__buffer += numpy.where(value, ord('T'), ord('F')).astype('u1').tobytes()
+            return
+        if compact is not None:
+            width, table = compact
+            self.__buffer += _pack_compact(value.astype('>i%d' % width).tobytes(), width, table)
+            return
+        tag, _, dtype, _ = _PACKED_ELEMENTS[_type]
+        packed = numpy.empty(len(value), dtype=[('tag', 'u1'), ('value', dtype)])
+        packed['tag'] = ord(tag)
+        packed['value'] = value
+        self.__buffer += packed.tobytes()
 
     def _encode_list(self, value):
         """
@@ -345,100 +1185,218 @@ class Request(object):
         :param value:
         :return:
         """
-        result = []
         length = len(value)
         if length == 0:
             # 没有值则无法判断类型，一律返回null
             return self._encode_single_value(None)
-        if isinstance(value[0], bool):
-            _type = '[boolean'
-        elif isinstance(value[0], int):
-            _type = '[int'
-        elif isinstance(value[0], float):
-            _type = '[double'
-        elif isinstance(value[0], str):
-            _type = '[string'
-        elif isinstance(value[0], JavaObject):
-            _type = '[object'
-        else:
-            raise DataError('Unknown list type: {}'.format(value[0]))
-        if length < 0x7:
-            result.append(0x70 + length)
-            if _type not in self.types:
-                self.types.append(_type)
-                result.extend(self._encode_single_value(_type))
+        if self._encode_ref(value):
+            return
+        # 列表中的元素类型一致，编码方法只需要根据第一个元素确定一次
+        encode, _, _type = _get_type_entry(value[0])
+        if _type is None:
+            # 无法确定元素类型的列表（例如字典、列表、日期组成的列表），按照无类型的列表逐个编码
+            buffer = self.__buffer
+            if length <= 0x7:
+                buffer.append(0x78 + length)
             else:
-                result.extend(self._encode_single_value(self.types.index(_type)))
-        else:
-            result.append(0x56)
-            if _type not in self.types:
-                self.types.append(_type)
-                result.extend(self._encode_single_value(_type))
-            else:
-                result.extend(self._encode_single_value(self.types.index(_type)))
-            result.extend(self._encode_single_value(length))
+                buffer.append(0x58)
+                self._encode_int(length)
+            for v in value:
+                self._encode_single_value(v)
+            return
+        self._encode_list_head(_type, length)
+        first_type = type(value[0])
         for v in value:
-            if type(value[0]) != type(v):
+            if type(v) is not first_type:
                 raise DataError('All elements in list must be the same type, first type'
-                                       ' is {0} but current type is {1}'.format(type(value[0]), type(v)))
-            result.extend(self._encode_single_value(v))
-        return result
-    
+                                ' is {0} but current type is {1}'.format(first_type, type(v)))
+            encode(self, v)
+
+    def _encode_binary(self, value):
+        """
+        对二进制数据进行编码，对应Java中的byte[]
+        超过BINARY_CHUNK_SIZE的数据拆分为多个'A'分块，最后一块使用'B'
+        不小于BINARY_ZERO_COPY_SIZE的数据不复制到缓冲区，发送时作为单独的分段，所以在请求发送完成前不能修改原始数据
+        :param value: bytes/bytearray/memoryview
+        :return:
+        """
+        buffer = self.__buffer
+        data = memoryview(value)
+        if data.format != 'B' or data.ndim != 1:
+            data = data.cast('B')
+        length = len(data)
+        if length <= 0xf:
+            buffer.append(0x20 + length)
+            buffer += data
+            return
+        if length <= 0x3ff:
+            buffer.append(0x34 + (length >> 8))
+            buffer.append(length & 0xff)
+            buffer += data
+            return
+
+        zero_copy = length >= BINARY_ZERO_COPY_SIZE
+        offset = 0
+        while offset < length:
+            chunk = data[offset:offset + BINARY_CHUNK_SIZE]
+            offset += len(chunk)
+            buffer += struct.pack('!cH', b'B' if offset == length else b'A', len(chunk))
+            if zero_copy:
+                self.__external.append((len(buffer), chunk))
+            else:
+                buffer += chunk
+
+    def _encode_set(self, value):
+        """
+        对一个集合进行编码，对应java.util.HashSet
+        :param value:
+        :return:
+        """
+        if self._encode_ref(value):
+            return
+        self._encode_list_head('java.util.HashSet', len(value))
+        for v in value:
+            self._encode_single_value(v)
+
+    def _encode_datetime(self, value):
+        """
+        对日期时间进行编码，对应java.util.Date，没有时区信息的datetime按照本地时间处理
+        整分钟的时间使用紧凑的0x4b格式
+        :param value:
+        :return:
+        """
+        if value.tzinfo is None:
+            value = value.astimezone()
+        mills = (value - _EPOCH) // _MILLISECOND
+        if mills % 60000 == 0 and MIN_INT_32 <= mills // 60000 <= MAX_INT_32:
+            self.__buffer += struct.pack('!Bi', 0x4b, mills // 60000)
+        else:
+            self.__buffer += struct.pack('!Bq', 0x4a, mills)
+
+    def _encode_date(self, value):
+        """
+        对日期进行编码，对应当天0点（本地时间）的java.util.Date
+        :param value:
+        :return:
+        """
+        self._encode_datetime(datetime(value.year, value.month, value.day))
+
+    def _encode_decimal(self, value):
+        """
+        对Decimal进行编码，对应java.math.BigDecimal
+        :param value:
+        :return:
+        """
+        self._encode_object(JavaObject('java.math.BigDecimal', {'value': str(value)}))
+
+    def _encode_uuid(self, value):
+        """
+        对UUID进行编码，对应java.util.UUID
+        :param value:
+        :return:
+        """
+        most, least = value.int >> 64, value.int & 0xffffffffffffffff
+        # Java中的long是有符号的
+        if most >= 0x8000000000000000:
+            most -= 0x10000000000000000
+        if least >= 0x8000000000000000:
+            least -= 0x10000000000000000
+        self._encode_object(JavaObject('java.util.UUID', {'mostSigBits': most, 'leastSigBits': least}))
+
     def _encode_dict(self, value):
         """
         对一个字典进行编码
         :param value:
         :return:
         """
-        result = []
         length = len(value)
         if length == 0:
             return self._encode_single_value(None)
-        
-        result.append("H")
-        for k,v in value.items():
-            result.extend(self._encode_single_value(k))
-            result.extend(self._encode_single_value(v))
-        result.append("Z")
-        return result
+        if self._encode_ref(value):
+            return
+
+        self.__buffer.append(ord('H'))
+        for k, v in value.items():
+            self._encode_single_value(k)
+            self._encode_single_value(v)
+        self.__buffer.append(ord('Z'))
 
     def _encode_single_value(self, value):
         """
-        根据hessian协议对单个变量进行编码
+        根据hessian协议对单个变量进行编码，编码结果直接写入请求的缓冲区
+        编码方法根据type(value)在类型注册表中查找，参见register_type
         :param value:
         :return:
         """
-        # 布尔类型
-        if isinstance(value, bool):
-            return self._encode_bool(value)
-        # 整型（包括长整型）
-        elif isinstance(value, int):
-            return self._encode_int(value)
-        # 浮点类型
-        elif isinstance(value, float):
-            return self._encode_float(value)
-        # 字符串类型
-        elif isinstance(value, str):
-            return self._encode_str(value)
-        # 对象类型
-        elif isinstance(value, JavaObject):
-            return self._encode_object(value)
-        # 列表(list)类型，不可以使用tuple替代
-        elif isinstance(value, list):
-            return self._encode_list(value)
-        elif isinstance(value, dict):
-            return self._encode_dict(value)
-        # null
-        elif value is None:
-            return [ord('N')]
-        else:
-            raise DataError('Unknown argument type: {}'.format(value))
+        entry = _dispatch_types.get(type(value))
+        if entry is None:
+            entry = _get_type_entry(value)
+        entry[0](self, value)
+
 
+# python类型 -> (编码方法, 作为方法参数时的类型描述, 作为列表元素时列表的类型)
+_registered_types = {}
+# 实际用于分派的表，在_registered_types的基础上缓存了通过MRO查找到的子类
+_dispatch_types = {}
 
-def get_request_body_length(body):
+
+def register_type(py_type, encoder, signature='Ljava/lang/Object;', list_type=None):
     """
-    获取body的长度，并将其转为长度为4个字节的字节数组
-    :param body:
+    注册一个python类型的编码方法，已经注册过的类型会被覆盖，其子类在没有单独注册时也使用此编码方法
+    :param py_type:   python类型
+    :param encoder:   编码方法，encoder(request, value)，可以使用request.write写入已经编码好的字节，
+                      或者使用request.encode_value编码其他的值，例如：
+                      lambda request, value: request.encode_value(JavaObject('com.example.Money', {...}))
+    :param signature: 作为方法参数时的类型描述，例如：Ljava/util/Date;，
+                      也可以是一个方法signature(request, value)，根据值计算得到类型描述
+    :param list_type: 作为列表元素时列表的类型，例如：[string，为None时列表按照无类型列表编码
     :return:
     """
-    return list(bytearray(struct.pack('!i', len(body))))
\ No newline at end of file
+    global _dispatch_types
+    _registered_types[py_type] = (encoder, signature, list_type)
+    _dispatch_types = dict(_registered_types)  # 类型发生变化后重新查找子类
+
+
+def _get_type_entry(value):
+    """
+    根据值的类型在注册表中查找编码方法，没有直接注册的类型沿着MRO查找，找到后缓存
+    :param value:
+    :return: (编码方法, 类型描述, 列表类型)
+    """
+    cls = type(value)
+    entry = _dispatch_types.get(cls)
+    if entry is not None:
+        return entry
+    for base in cls.__mro__:
+        entry = _registered_types.get(base)
+        if entry is not None:
+            _dispatch_types[cls] = entry
+            return entry
+    raise DataError('Unknown argument type: {}'.format(value))
+
+
+register_type(bool, Request._encode_bool, 'Z', '[boolean')
+register_type(int, Request._encode_int, 'J', '[int')
+register_type(float, Request._encode_float, 'D', '[double')
+register_type(str, Request._encode_str, 'Ljava/lang/String;', '[string')
+register_type(type(None), Request._encode_null)
+register_type(JavaObject, Request._encode_object, Request._get_object_class_name, '[object')
+register_type(list, Request._encode_list, Request._get_list_class_name)
+register_type(JavaObjectBatch, Request._encode_batch, Request._get_batch_class_name)
+register_type(tuple, Request._encode_list, Request._get_list_class_name)
+register_type(dict, Request._encode_dict, 'Ljava/util/Map;')
+register_type(bytes, Request._encode_binary, '[B')
+register_type(bytearray, Request._encode_binary, '[B')
+register_type(memoryview, Request._encode_binary, '[B')
+register_type(set, Request._encode_set, 'Ljava/util/Set;')
+register_type(frozenset, Request._encode_set, 'Ljava/util/Set;')
+register_type(array, Request._encode_array, Request._get_array_class_name)
+register_type(datetime, Request._encode_datetime, 'Ljava/util/Date;')
+register_type(date, Request._encode_date, 'Ljava/util/Date;')
+register_type(Decimal, Request._encode_decimal, 'Ljava/math/BigDecimal;')
+register_type(UUID, Request._encode_uuid, 'Ljava/util/UUID;')
+register_class('java.util.UUID', ['mostSigBits', 'leastSigBits'], {'mostSigBits': 'long', 'leastSigBits': 'long'})
+if numpy is not None:
+    register_type(numpy.ndarray, Request._encode_ndarray, Request._get_ndarray_class_name)
+    register_type(numpy.bool_, lambda request, value: request._encode_bool(bool(value)), 'Z')
+    register_type(numpy.integer, lambda request, value: request._encode_int(int(value)), 'J')
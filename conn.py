@@ -3,12 +3,27 @@
 # @Author   : yh
 # @Remark   : 连接池
 
+import os
 import socket
 import threading
 import time
-from queue import Queue
+import logging
+import weakref
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from itertools import count
+from queue import Empty
+from struct import pack, unpack_from
 
-from .constants import CONN_MAX
+from .constants import CONN_MAX, CONN_MIN, CONN_IDLE_TIME_OUT, CONN_MAX_LIFETIME, CLI_HEARTBEAT_REQ_HEAD, \
+    CLI_HEARTBEAT_RES_HEAD, CLI_HEARTBEAT_TAIL, HEAD_LENGTH, MUX_CONN_MAX
+from .util import get_invoke_id
+
+# 一次sendmsg调用最多可以发送的分段数量
+IOV_MAX = os.sysconf('SC_IOV_MAX') if hasattr(os, 'sysconf') else 1024
+dubbo_logger = logging.getLogger('dubbo')
+# 连接池可以收回保留在线程中的连接时，等待空闲连接的线程每隔此时间（秒）重新收回一次
+RECLAIM_INTERVAL = 0.1
 
 
 class Connection(object):
@@ -22,6 +37,7 @@ class Connection(object):
         sock.connect((host, port))
         self.__sock = sock
         self.__host = '%s:%s' % (host, port)
+        self.created_at = self.last_used = time.monotonic()  # 创建、最后使用的时间，由连接池维护
 
     def write(self, data) -> None:
         while 1:
@@ -37,11 +53,70 @@ class Connection(object):
                 else:
                     raise e
 
+    def write_segments(self, segments) -> None:
+        """
+        使用sendmsg把多个分段一次性发送出去，分段之间不需要拼接复制
+        :param segments: [bytes/bytearray/memoryview, ...]
+        """
+        if len(segments) == 1:
+            # 只有一个分段时直接发送请求的缓冲区，不再复制
+            self.__sock.sendall(segments[0])
+            return
+        if not hasattr(self.__sock, 'sendmsg'):
+            self.write(b''.join(segments))
+            return
+        segments = [memoryview(segment) for segment in segments]
+        while segments:
+            try:
+                length = self.__sock.sendmsg(segments[:IOV_MAX])
+            except socket.error as e:
+                if e.errno == 35:
+                    time.sleep(.01)
+                    continue
+                raise e
+            # 移除已经发送完的分段，部分发送的分段只保留剩余的部分
+            while segments and length >= len(segments[0]):
+                length -= len(segments[0])
+                segments.pop(0)
+            if length:
+                segments[0] = segments[0][length:]
+
     def read(self, length) -> bytearray:
         return bytearray(self.__sock.recv(length))
 
+    def recv_into(self, buffer, length=0) -> int:
+        """
+        把数据直接接收到已有的缓冲区中，不创建新的bytes对象
+        :param buffer: 可写的bytearray/memoryview
+        :param length: 最多接收的字节数，为0时使用buffer的长度
+        :return: 实际接收的字节数，连接已经关闭时抛出IOError
+        """
+        received = self.__sock.recv_into(buffer, length)
+        if not received and (length or len(buffer)):
+            raise IOError('dubbo连接已关闭')
+        return received
+
+    def read_exact(self, length) -> bytearray:
+        """
+        读取恰好length个字节，结果只分配一次，不会多读取属于下一个响应的数据
+        :param length:
+        :return:
+        """
+        data = bytearray(length)
+        with memoryview(data) as view:
+            received = 0
+            while received < length:
+                received += self.recv_into(view[received:], length - received)
+        return data
+
     def close(self) -> None:
-        self.__sock.shutdown(socket.SHUT_RDWR)
+        if self.__sock.fileno() == -1:  # 已经关闭
+            return
+        try:
+            # shutdown会唤醒其他线程中阻塞的recv
+            self.__sock.shutdown(socket.SHUT_RDWR)
+        except OSError:  # 对方已经断开
+            pass
         self.__sock.close()
 
     def remote_host(self) -> str:
@@ -51,24 +126,574 @@ class Connection(object):
         return self.__sock.fileno()
 
     def __del__(self):
-        self.__sock.shutdown(socket.SHUT_RDWR)
-        self.__sock.close()
+        self.close()
 
 
-class ConnectionPool(object):
+class MultiplexedConnection(object):
+    """
+    多路复用的连接：多个线程在同一个socket上并发地发送请求，不需要等待之前的响应返回
+    写入请求时加锁，保证请求帧之间不会交错；由一个专门的线程读取响应，根据头部中的调用ID交给对应的Future
+    服务端发送的心跳请求的响应先放入队列，读取线程不等待写锁，由持有写锁的线程在写入之后发送
+    """
+
+    def __init__(self, host, port):
+        # 保留socket的超时时间：写入超时时关闭连接，读取线程只在两个响应之间容忍超时
+        self.__conn = Connection(host, port)
+        self.__write_lock = threading.Lock()
+        self.__lock = threading.Lock()  # 保护__pending与__error
+        self.__pending = {}  # 调用ID -> 等待响应的Future
+        self.__error = None  # 连接关闭的原因，不为None时连接不再可用
+        self.__heartbeats = deque()  # 等待发送的心跳响应
+        self.__reader = threading.Thread(target=self.__read_loop, name='dubbo-reader-%s:%s' % (host, port),
+                                         daemon=True)
+        self.__reader.start()
+
+    def submit(self, invoke_id, segments, time_out=None) -> Future:
+        """
+        发送一个请求，不等待响应
+        写入受socket的超时时间限制，写入超时或者出错时关闭连接
+        :param invoke_id: 请求的调用ID，即Request.invoke_id
+        :param segments: 编码后的请求，见Request.encode_segments
+        :param time_out: 等待其他线程写入完成的最大时间，单位：秒，None表示一直等待，超时时抛出FutureTimeoutError
+        :return: Future，结果为(响应头, 响应体)，连接关闭时为IOError
+        """
+        future = Future()
+        with self.__lock:
+            if self.__error is not None:
+                raise self.__error
+            self.__pending[invoke_id] = future
+        if not self.__write_lock.acquire(timeout=-1 if time_out is None else time_out):
+            self.cancel(invoke_id)
+            raise FutureTimeoutError('等待写入请求超时')
+        try:
+            self.__conn.write_segments(segments)
+        except Exception as e:
+            # 请求可能只写入了一部分，之后的数据都无法正确解析，只能关闭连接
+            self.close(e)
+            raise self.__error
+        finally:
+            self.__write_lock.release()
+        self.__flush_heartbeats()
+        return future
+
+    def cancel(self, invoke_id) -> None:
+        """
+        不再等待某个请求的响应（例如调用超时），之后到达的响应直接丢弃
+        :param invoke_id:
+        """
+        with self.__lock:
+            self.__pending.pop(invoke_id, None)
+
+    def ping(self, time_out) -> None:
+        """
+        发送心跳请求并等待心跳响应
+        :param time_out: 等待的最大时间，单位：秒
+        """
+        invoke_id = get_invoke_id()
+        future = self.submit(invoke_id, [bytes(CLI_HEARTBEAT_REQ_HEAD) + pack('!q', invoke_id) +
+                                         bytes(CLI_HEARTBEAT_TAIL)])
+        try:
+            future.result(time_out)
+        finally:
+            self.cancel(invoke_id)
+
+    def pending(self) -> int:
+        """
+        正在等待响应的请求数量
+        :return:
+        """
+        return len(self.__pending)
+
+    def closed(self) -> bool:
+        return self.__error is not None
+
+    def close(self, error=None) -> None:
+        """
+        关闭连接，所有等待中的请求都以IOError结束
+        :param error: 关闭的原因
+        """
+        with self.__lock:
+            if self.__error is not None:
+                return
+            if isinstance(error, IOError) and not isinstance(error, socket.timeout):
+                self.__error = error
+            else:
+                # 超时也转换为IOError，避免等待中的调用把连接关闭当作调用超时
+                self.__error = IOError('dubbo连接已关闭: %s' % error)
+            pending, self.__pending = self.__pending, {}
+        self.__conn.close()
+        for future in pending.values():
+            future.set_exception(self.__error)
+
+    def remote_host(self) -> str:
+        return self.__conn.remote_host()
+
+    def __read_loop(self):
+        """
+        读取线程：依次读取完整的响应，按照调用ID分发，连接出错时关闭连接
+        """
+        conn = self.__conn
+        try:
+            while True:
+                head = self.__read_head()
+                if head is None:  # 连接已经关闭
+                    return
+                if head[0] != 0xda or head[1] != 0xbb:
+                    raise IOError('响应头错误: %s' % str(head))
+                invoke_id, body_length = unpack_from('!qi', head, 4)
+                body = conn.read_exact(body_length)
+                if head[2] & 0xa0 == 0xa0:  # 服务端发送的心跳请求，使用相同的调用ID回复
+                    self.__heartbeats.append(bytes(CLI_HEARTBEAT_RES_HEAD) + head[4:12] + bytes(CLI_HEARTBEAT_TAIL))
+                    self.__flush_heartbeats()
+                    continue
+                with self.__lock:
+                    future = self.__pending.pop(invoke_id, None)
+                if future is not None:
+                    future.set_result((head, body))
+        except Exception as e:
+            self.close(e)
+
+    def __flush_heartbeats(self):
+        """
+        发送队列中的心跳响应，不等待写锁：写锁被其他线程持有时，由该线程在释放写锁之后发送
+        """
+        heartbeats = self.__heartbeats
+        while heartbeats and self.__write_lock.acquire(False):
+            try:
+                while heartbeats:
+                    self.__conn.write(heartbeats.popleft())
+            except Exception as e:
+                self.close(e)
+                return
+            finally:
+                self.__write_lock.release()
+
+    def __read_head(self):
+        """
+        读取下一个响应的头部，还没有收到任何数据时超时只表示暂时没有响应，继续等待；
+        收到部分数据之后再超时说明对方已经不可用，由调用方关闭连接
+        :return: 响应头，连接已经关闭时返回None
+        """
+        conn = self.__conn
+        head = bytearray(HEAD_LENGTH)
+        with memoryview(head) as view:
+            received = 0
+            while not received:
+                try:
+                    received = conn.recv_into(view, HEAD_LENGTH)
+                except socket.timeout:
+                    if self.__error is not None:
+                        return None
+            while received < HEAD_LENGTH:
+                received += conn.recv_into(view[received:], HEAD_LENGTH - received)
+        return head
+
+
+class HostConnectionPool(object):
+    """
+    单个host的连接池，连接在需要时才创建，数量在min_size与max_size之间
+    空闲超过idle_timeout的连接被关闭（至少保留min_size个），创建后超过max_lifetime的连接在归还时被关闭
+    空闲的连接后进先出，最近使用过的连接优先被再次使用，其余的连接才有机会空闲超时
+    """
+
+    def __init__(self, host, min_size=CONN_MIN, max_size=CONN_MAX, idle_timeout=CONN_IDLE_TIME_OUT,
+                 max_lifetime=CONN_MAX_LIFETIME):
+        """
+        :param host: 远程主机地址，例如：172.21.4.98:20882
+        :param min_size: 最少保持的连接数量，由heartbeat在后台补足，不在获取连接时创建
+        :param max_size: 最多同时存在的连接数量
+        :param idle_timeout: 连接空闲的最大时间，单位：秒，None表示不限制
+        :param max_lifetime: 连接从创建开始的最大使用时间，单位：秒，None表示不限制
+        """
+        if not 0 <= min_size <= max_size or max_size <= 0:
+            raise ValueError('Invalid pool size: min_size={}, max_size={}'.format(min_size, max_size))
+        self.host = host
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self._idle = deque()  # 空闲的连接，右端为最近归还的连接
+        self._size = 0  # 已经创建的连接数量，包括正在创建的连接
+        self._in_use = 0  # 正在使用的连接数量
+        self._waiting = 0  # 正在等待空闲连接的线程数量
+        self._condition = threading.Condition(threading.Lock())
+        # 没有可用的连接时，在等待之前调用reclaim(host)收回保留在其他地方的连接，由ConnectionPool设置
+        # 返回True表示等待期间仍然可能有连接被保留，此时分段等待
+        self.reclaim = None
+        # 统计信息
+        self._created = 0
+        self._closed = 0
+        self._acquired = 0
+        self._waits = 0  # 需要等待才获取到连接的次数
+        self._timeouts = 0  # 等待超时的次数
+        self._wait_time = 0.0
+        self._max_wait_time = 0.0
+        self._since = self._changed = time.monotonic()
+        self._busy_time = 0.0  # 使用中的连接数量对时间的累计，用于计算平均利用率
+        # 已经结束的线程、已经收回的sticky连接的统计，仍然保留在线程中的部分由ConnectionPool.stats统计
+        self._sticky_hits = 0
+        self._sticky_idle_time = 0.0
+
+    def get(self, time_out) -> Connection:
+        """
+        获取一个连接：优先使用空闲的连接，没有空闲连接且数量未达到上限时创建，否则等待其他线程归还
+        :param time_out: 最大等待时间，单位：秒
+        :return:
+        """
+        start = time.monotonic()
+        expired = []
+        conn = None
+        reclaimed = sliced = False
+        try:
+            with self._condition:
+                try:
+                    while True:
+                        now = time.monotonic()
+                        conn = self._pop_idle(now, expired)
+                        if conn is not None:
+                            break
+                        if self._size < self.max_size:
+                            self._size += 1  # 先占用名额，在锁外创建连接
+                            break
+                        remaining = start + time_out - now
+                        if remaining <= 0:
+                            self._timeouts += 1
+                            raise Empty()
+                        reclaim = self.reclaim
+                        if reclaim is not None and not reclaimed:
+                            # 释放锁后收回保留在其他地方的连接，然后重新尝试
+                            self._condition.release()
+                            try:
+                                sliced = reclaim(self.host)
+                            finally:
+                                self._condition.acquire()
+                            reclaimed = True
+                            continue
+                        self._waiting += 1
+                        try:
+                            # 在等待期间也可能有连接被保留起来，所以分段等待，每次等待后重新收回
+                            self._condition.wait(min(remaining, RECLAIM_INTERVAL) if sliced else remaining)
+                        finally:
+                            self._waiting -= 1
+                        reclaimed = False
+                    self._mark_in_use(now, 1)
+                    self._acquired += 1
+                    wait_time = now - start
+                    if wait_time > 0.001:
+                        self._waits += 1
+                        self._wait_time += wait_time
+                        self._max_wait_time = max(self._max_wait_time, wait_time)
+                finally:
+                    self._closed += len(expired)
+        finally:
+            # 超时等异常退出时也要关闭已经取出的过期连接，它们的名额在_pop_idle中已经释放
+            self._close_all(expired)
+        if conn is not None:
+            return conn
+
+        try:
+            return self._create()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._mark_in_use(time.monotonic(), -1)
+                self._condition.notify()
+            raise
+
+    def release(self, conn) -> None:
+        """
+        归还连接，超过最大使用时间的连接直接关闭
+        :param conn:
+        """
+        now = time.monotonic()
+        conn.last_used = now
+        expired = self.max_lifetime is not None and now - conn.created_at > self.max_lifetime
+        with self._condition:
+            self._mark_in_use(now, -1)
+            if expired:
+                self._size -= 1
+                self._closed += 1
+            else:
+                self._idle.append(conn)
+            self._condition.notify()
+        if expired:
+            conn.close()
+
+    def discard(self, conn) -> None:
+        """
+        丢弃一个出错的连接，释放其名额，之后需要时重新创建
+        :param conn:
+        """
+        with self._condition:
+            self._mark_in_use(time.monotonic(), -1)
+            self._size -= 1
+            self._closed += 1
+            self._condition.notify()
+        conn.close()
+
+    def borrow_idle(self) -> list:
+        """
+        取出当前所有空闲且未过期的连接，不等待，不计入获取连接的次数，用于心跳
+        :return: 按照归还的先后顺序排列，依次通过return_borrowed归还后空闲连接的顺序不变
+        """
+        expired = []
+        conns = []
+        with self._condition:
+            now = time.monotonic()
+            while True:
+                conn = self._pop_idle(now, expired)
+                if conn is None:
+                    break
+                conns.append(conn)
+            self._closed += len(expired)
+            self._mark_in_use(now, len(conns))
+        self._close_all(expired)
+        conns.reverse()
+        return conns
+
+    def has_waiters(self) -> bool:
+        """
+        是否有线程正在等待空闲的连接，不加锁，结果只作为参考
+        :return:
+        """
+        return self._waiting > 0
+
+    def return_borrowed(self, conn, ok=True) -> None:
+        """
+        归还borrow_idle取出的连接，或者线程中保留的连接，不更新最后使用的时间
+        :param conn:
+        :param ok: 连接是否可用，不可用时关闭
+        """
+        with self._condition:
+            self._mark_in_use(time.monotonic(), -1)
+            if ok:
+                self._idle.append(conn)
+            else:
+                self._size -= 1
+                self._closed += 1
+            self._condition.notify()
+        if not ok:
+            conn.close()
+
+    def evict(self) -> None:
+        """
+        关闭空闲超时或者超过最大使用时间的连接，连接总数不少于min_size
+        """
+        expired = []
+        with self._condition:
+            now = time.monotonic()
+            kept = deque()
+            # 从最近归还的连接开始检查，优先保留最近使用过的连接
+            while self._idle:
+                conn = self._idle.pop()
+                if self._is_expired(conn, now, len(kept) + self._in_use):
+                    expired.append(conn)
+                    self._size -= 1
+                else:
+                    kept.appendleft(conn)
+            self._idle = kept
+            self._closed += len(expired)
+        self._close_all(expired)
+
+    def fill(self) -> None:
+        """
+        补足最少的连接数量，在后台调用，创建失败时只记录日志
+        """
+        while True:
+            with self._condition:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._create()
+            except IOError as e:
+                with self._condition:
+                    self._size -= 1
+                dubbo_logger.debug('dubbo连接创建失败：host: %s，%s' % (self.host, e))
+                return
+            with self._condition:
+                self._idle.appendleft(conn)
+                self._condition.notify()
+
+    def record_sticky(self, hits=0, idle_time=0.0) -> None:
+        """
+        累计sticky模式下的统计，在线程结束或者连接被收回时由ConnectionPool调用
+        :param hits: 线程中保留的连接被直接使用的次数
+        :param idle_time: 连接保留在线程中空闲的时间，单位：秒
+        """
+        with self._condition:
+            self._sticky_hits += hits
+            self._sticky_idle_time += idle_time
+
+    def stats(self, sticky=0, sticky_hits=0, sticky_idle_time=0.0) -> dict:
+        """
+        连接池的统计信息
+        保留在线程中的连接计入in_use，但是不计入利用率，直接使用保留的连接的次数计入acquired
+        :param sticky: 当前保留在线程中的连接数量，由ConnectionPool统计
+        :param sticky_hits: 仍然存活的线程直接使用保留的连接的次数，由ConnectionPool统计
+        :param sticky_idle_time: 连接保留在仍然存活的线程中空闲的时间，由ConnectionPool统计
+        :return:
+        """
+        with self._condition:
+            now = time.monotonic()
+            sticky_hits += self._sticky_hits
+            busy_time = self._busy_time + self._in_use * (now - self._changed) - self._sticky_idle_time - \
+                sticky_idle_time
+            elapsed = now - self._since
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'waiting': self._waiting,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'created': self._created,
+                'closed': self._closed,
+                'acquired': self._acquired + sticky_hits,
+                'sticky': sticky,
+                'sticky_hits': sticky_hits,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'wait_time': self._wait_time,
+                'avg_wait_time': self._wait_time / self._waits if self._waits else 0.0,
+                'max_wait_time': self._max_wait_time,
+                'utilization': (self._in_use - sticky) / self.max_size,
+                'avg_utilization': max(busy_time, 0.0) / elapsed / self.max_size if elapsed > 0 else 0.0,
+            }
+
+    def close(self) -> None:
+        """
+        关闭所有空闲的连接，使用中的连接在归还后仍然可以继续使用
+        """
+        with self._condition:
+            idle, self._idle = self._idle, deque()
+            self._size -= len(idle)
+            self._closed += len(idle)
+        self._close_all(idle)
+
+    def _create(self) -> Connection:
+        ip, port = self.host.split(':')
+        conn = Connection(ip, int(port))
+        with self._condition:
+            self._created += 1
+        return conn
+
+    def _pop_idle(self, now, expired):
+        """
+        取出最近归还的未过期的空闲连接，过期的连接放入expired，需要持有锁
+        :param now:
+        :param expired:
+        :return: 没有可用的空闲连接时返回None
+        """
+        idle = self._idle
+        while idle:
+            conn = idle.pop()
+            if self._is_expired(conn, now, 0):
+                expired.append(conn)
+                self._size -= 1
+                continue
+            return conn
+        return None
+
+    def _is_expired(self, conn, now, kept):
+        """
+        :param conn:
+        :param now:
+        :param kept: 除这个连接以外保留的连接数量，空闲超时只在保留的数量不少于min_size时生效
+        :return:
+        """
+        if self.max_lifetime is not None and now - conn.created_at > self.max_lifetime:
+            return True
+        return self.idle_timeout is not None and now - conn.last_used > self.idle_timeout and kept >= self.min_size
+
+    def _mark_in_use(self, now, delta):
+        """
+        修改使用中的连接数量，同时累计利用率，需要持有锁
+        :param now:
+        :param delta:
+        """
+        self._busy_time += self._in_use * (now - self._changed)
+        self._changed = now
+        self._in_use += delta
+
+    @staticmethod
+    def _close_all(conns):
+        for conn in conns:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+
+class _StickyConnections(object):
     """
-    连接池
+    一个线程保留的连接，线程结束时随线程的局部变量一起被回收，此时把其中的连接归还到连接池
     """
+    __slots__ = ('conns', 'hits', 'idle_time', '__weakref__')
 
     def __init__(self):
-        self._connection_pool = {}  # 存放连接池的字典
+        self.conns = {}  # host -> Connection
+        # 只由所属的线程修改，不需要加锁
+        self.hits = {}  # host -> 直接使用保留的连接的次数
+        self.idle_time = {}  # host -> 连接保留在线程中空闲的时间
 
-    def __init_conn(self, host: str) -> None:
-        ip, port = host.split(':')
-        if not self._connection_pool.get(host):
-            self._connection_pool[host] = Queue(maxsize=CONN_MAX)
-            for _ in range(CONN_MAX):
-                self._connection_pool[host].put(Connection(ip, int(port)))
+
+class ConnectionPool(object):
+    """
+    连接池，每个host一个HostConnectionPool，在第一次使用时创建
+
+    sticky模式下，线程归还的连接先保留在线程中，同一个线程下次获取同一个host的连接时直接使用，不需要加锁，
+    保留的连接仍然计入所属host的连接数量，所以不会超过max_size，同时：
+    * 有其他线程在等待连接时，归还的连接直接放回连接池
+    * 连接池中没有可用的连接时，先收回其他线程中保留的连接
+    * 线程结束时、由heartbeat发现保留的连接空闲超过STICKY_IDLE_TIME_OUT时，连接被放回连接池
+    """
+
+    def __init__(self, min_size=CONN_MIN, max_size=CONN_MAX, idle_timeout=CONN_IDLE_TIME_OUT,
+                 max_lifetime=CONN_MAX_LIFETIME, sticky=False):
+        """
+        参数为每个host的默认配置，见HostConnectionPool，可以通过configure单独设置某个host
+        :param sticky: 是否开启sticky模式，之后也可以通过修改sticky属性开启或者关闭
+        """
+        self._connection_pool = {}  # host -> HostConnectionPool
+        self._options = {'min_size': min_size, 'max_size': max_size, 'idle_timeout': idle_timeout,
+                         'max_lifetime': max_lifetime}
+        self._host_options = {}  # host -> 单独设置的配置
+        self._lock = threading.Lock()
+        self.sticky = sticky
+        self._local = threading.local()  # 每个线程的_StickyConnections
+        self._sticky_threads = weakref.WeakSet()  # 所有线程的_StickyConnections，用于收回其中的连接
+
+    def configure(self, host: str, **options) -> None:
+        """
+        单独设置某个host的连接池配置，已经创建的连接池立即生效
+        :param host:
+        :param options: min_size、max_size、idle_timeout、max_lifetime
+        """
+        with self._lock:
+            self._host_options.setdefault(host, {}).update(options)
+            pool = self._connection_pool.get(host)
+        if pool is not None:
+            with pool._condition:
+                for key, value in options.items():
+                    setattr(pool, key, value)
+                pool._condition.notify_all()
+
+    def get_pool(self, host: str) -> HostConnectionPool:
+        """
+        获取host对应的连接池，第一次使用时创建，只创建连接池而不创建连接
+        :param host:
+        :return:
+        """
+        pool = self._connection_pool.get(host)
+        if pool is None:
+            with self._lock:
+                pool = self._connection_pool.get(host)
+                if pool is None:
+                    options = dict(self._options, **self._host_options.get(host, {}))
+                    pool = self._connection_pool[host] = HostConnectionPool(host, **options)
+                    pool.reclaim = self._reclaim_for_pool
+        return pool
 
     def new_conn(self, host: str) -> Connection:
         ip, port = host.split(':')
@@ -76,15 +701,180 @@ class ConnectionPool(object):
         return conn
 
     def get_conn(self, host: str, time_out: int) -> Connection:
-        if not self._connection_pool.get(host):
-            self.__init_conn(host)
-        return self._connection_pool[host].get(timeout=time_out)
+        if not self.sticky:
+            return self.get_pool(host).get(time_out)
+
+        holder = getattr(self._local, 'holder', None)
+        if holder is not None:
+            # 从线程保留的连接中取出，与收回连接的线程之间通过dict.pop的原子性保证只有一方能够取到
+            conn = holder.conns.pop(host, None)
+            if conn is not None:
+                pool = self._connection_pool[host]
+                now = time.monotonic()
+                holder.idle_time[host] = holder.idle_time.get(host, 0.0) + now - conn.last_used
+                if pool.max_lifetime is None or now - conn.created_at <= pool.max_lifetime:
+                    holder.hits[host] = holder.hits.get(host, 0) + 1
+                    return conn
+                pool.release(conn)  # 超过最大使用时间，归还时被关闭
+        return self.get_pool(host).get(time_out)
 
     def release_conn(self, host: str, conn: Connection) -> None:
-        self._connection_pool[host].put(conn)
+        pool = self.get_pool(host)
+        if self.sticky and not pool.has_waiters():
+            conns = getattr(self._local, 'conns', None)
+            if conns is None:
+                conns = self._register_thread()
+            if host not in conns:
+                conn.last_used = time.monotonic()
+                conns[host] = conn
+                return
+        pool.release(conn)
+
+    def reclaim_sticky(self, host=None, idle_time=0) -> None:
+        """
+        把线程中保留的连接放回连接池
+        :param host: 只收回这个host的连接，None表示所有host
+        :param idle_time: 只收回空闲时间超过此值的连接，单位：秒
+        """
+        with self._lock:
+            holders = list(self._sticky_threads)
+        now = time.monotonic()
+        for holder in holders:
+            conns = holder.conns
+            for key in ([host] if host is not None else list(conns)):
+                conn = conns.get(key)
+                if conn is None or now - conn.last_used < idle_time:
+                    continue
+                # 所属的线程可能同时取出了这个连接，只有成功取出的一方拥有它
+                conn = conns.pop(key, None)
+                if conn is not None:
+                    pool = self._connection_pool[key]
+                    pool.record_sticky(idle_time=time.monotonic() - conn.last_used)
+                    pool.return_borrowed(conn)
+
+    def _reclaim_for_pool(self, host) -> None:
+        """
+        HostConnectionPool没有可用的连接时调用，收回其他线程中保留的这个host的连接
+        :param host:
+        :return: 是否开启了sticky模式，即等待期间仍然可能有连接被保留
+        """
+        if self._sticky_threads:
+            self.reclaim_sticky(host)
+        return self.sticky
+
+    def _register_thread(self) -> dict:
+        """
+        当前线程第一次保留连接时调用，线程结束时归还其中的连接
+        :return:
+        """
+        holder = _StickyConnections()
+        self._local.holder = holder
+        self._local.conns = holder.conns
+        weakref.finalize(holder, self._return_sticky, holder.conns, holder.hits, holder.idle_time)
+        with self._lock:
+            self._sticky_threads.add(holder)
+        return holder.conns
+
+    def _return_sticky(self, conns, hits, idle_time) -> None:
+        """
+        线程结束时把其保留的连接放回连接池，同时把线程中的统计累计到连接池
+        :param conns:
+        :param hits:
+        :param idle_time:
+        """
+        for host in set(hits) | set(idle_time):
+            self._connection_pool[host].record_sticky(hits.get(host, 0), idle_time.get(host, 0.0))
+        while conns:
+            try:
+                host, conn = conns.popitem()
+            except KeyError:  # 同时被其他线程收回
+                break
+            pool = self._connection_pool[host]
+            pool.record_sticky(idle_time=time.monotonic() - conn.last_used)
+            pool.return_borrowed(conn)
+
+    def discard_conn(self, host: str, conn: Connection) -> None:
+        """
+        丢弃出错的连接，下次需要时重新创建
+        :param host:
+        :param conn:
+        """
+        self.get_pool(host).discard(conn)
 
     def all_conn(self) -> dict:
-        return self._connection_pool
+        with self._lock:
+            return dict(self._connection_pool)
+
+    def stats(self) -> dict:
+        """
+        所有host的连接池的统计信息，包括仍然保留在线程中的连接的统计，见HostConnectionPool.stats
+        :return: {host: HostConnectionPool.stats()}
+        """
+        with self._lock:
+            holders = list(self._sticky_threads)
+        now = time.monotonic()
+        live = {}  # host -> [保留的连接数量, 直接使用的次数, 空闲的时间]
+        for holder in holders:
+            for host, conn in list(holder.conns.items()):
+                item = live.setdefault(host, [0, 0, 0.0])
+                item[0] += 1
+                item[2] += now - conn.last_used
+            for host, hits in list(holder.hits.items()):
+                live.setdefault(host, [0, 0, 0.0])[1] += hits
+            for host, idle_time in list(holder.idle_time.items()):
+                live.setdefault(host, [0, 0, 0.0])[2] += idle_time
+        return {host: pool.stats(*live.get(host, ())) for host, pool in self.all_conn().items()}
 
 
 conn_pool = ConnectionPool()  # 全局连接池
+
+
+class MultiplexedConnectionPool(object):
+    """
+    多路复用的连接池，每个host保持固定数量的MultiplexedConnection，轮流分配给调用方，
+    已经关闭的连接在下次分配到时重新创建
+    """
+
+    def __init__(self, size=MUX_CONN_MAX):
+        self._size = size
+        self._connection_pool = {}  # host -> [MultiplexedConnection/None, ...]
+        self._counters = {}  # host -> 轮流分配使用的计数器
+        self._lock = threading.Lock()
+
+    def get_conn(self, host: str) -> MultiplexedConnection:
+        creating = None
+        with self._lock:
+            connections = self._connection_pool.get(host)
+            if connections is None:
+                connections = self._connection_pool[host] = [None] * self._size
+                self._counters[host] = count()
+            index = next(self._counters[host]) % self._size
+            conn = connections[index]
+            if conn is None or (not isinstance(conn, Future) and conn.closed()):
+                # 先用Future占用位置，在锁外创建连接，避免一个host连接缓慢时阻塞其他host的调用
+                creating = conn = connections[index] = Future()
+        if not isinstance(conn, Future):
+            return conn
+        if creating is None:  # 其他线程正在创建这个位置的连接
+            return conn.result()
+
+        try:
+            ip, port = host.split(':')
+            conn = MultiplexedConnection(ip, int(port))
+        except Exception as e:
+            with self._lock:
+                connections[index] = None
+            creating.set_exception(e)
+            raise
+        with self._lock:
+            connections[index] = conn
+        creating.set_result(conn)
+        return conn
+
+    def all_conn(self) -> dict:
+        with self._lock:
+            return {host: [conn for conn in connections if isinstance(conn, MultiplexedConnection)]
+                    for host, connections in self._connection_pool.items()}
+
+
+mux_pool = MultiplexedConnectionPool()  # 全局的多路复用连接池
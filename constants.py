@@ -22,7 +22,11 @@ response_status_message = {
 MAX_INT_32 = 2147483647
 # 32位整型的最小值
 MIN_INT_32 = -2147483648
+# 64位整型的最大值
+MAX_INT_64 = 9223372036854775807
 
+# dubbo协议头部的长度
+HEAD_LENGTH = 16
 # MAGIC_NUM(2) + FLAG(1) + STATUS(1)
 DEFAULT_REQUEST_META = num_2_byte_list(0xdabbc200)
 # 客户端对服务端发送的心跳的请求的头部
@@ -35,7 +39,17 @@ CLI_HEARTBEAT_TAIL = [0, 0, 0, 1] + num_2_byte_list(0x4e)
 
 # 每个host允许的最大连接数量
 CONN_MAX = 5
-# 默认每次读取长度
-DEFAULT_READ_PARAMS = 1500
+# 每个host最少保持的连接数量
+CONN_MIN = 1
+# 连接空闲的最大时间，单位：秒，超过后被关闭
+CONN_IDLE_TIME_OUT = 300
+# 连接从创建开始的最大使用时间，单位：秒，超过后在归还时被关闭
+CONN_MAX_LIFETIME = 3600
+# sticky模式下线程中保留的连接空闲超过此时间，单位：秒，由心跳放回连接池
+STICKY_IDLE_TIME_OUT = 10
+# 每个host的多路复用连接数量，每个连接上可以同时进行任意数量的调用
+MUX_CONN_MAX = 1
+# 增量解析响应体时接收缓冲区的大小，每接收一块就解析一次
+RECV_BUFFER_SIZE = 64 * 1024
 # 连接超时时间
 CONN_TIME_OUT = 10
@@ -4,12 +4,13 @@
 # @Remark   : 心跳
 import time
 import logging
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from struct import pack
 
 from mxsoftpy.exception import RPCConnError
 from .codec.decoder import parse_response_head
-from .conn import conn_pool
-from .constants import CLI_HEARTBEAT_TAIL, CLI_HEARTBEAT_REQ_HEAD, DEFAULT_READ_PARAMS, CONN_MAX, CONN_TIME_OUT
+from .conn import conn_pool, mux_pool
+from .constants import CLI_HEARTBEAT_TAIL, CLI_HEARTBEAT_REQ_HEAD, CONN_TIME_OUT, HEAD_LENGTH, STICKY_IDLE_TIME_OUT
 from .util import get_invoke_id
 
 dubbo_logger = logging.getLogger('dubbo')
@@ -22,20 +23,31 @@ def heartbeat():
 
     while 1:
         time.sleep(30)
-        conn_dict = conn_pool.all_conn()
-
-        for host, queue in conn_dict.items():
-            dubbo_logger.debug('dubbo_conn开始心跳：host: %s， queue: %s' % (str(host), queue.qsize()))
-            max_conn = CONN_MAX
-            while not queue.empty() and max_conn > 0:
-                conn = queue.get(timeout=CONN_TIME_OUT)
+        conn_pool.reclaim_sticky(idle_time=STICKY_IDLE_TIME_OUT)  # 线程中保留的空闲连接放回连接池后统一检查
+        for host, pool in conn_pool.all_conn().items():
+            pool.evict()  # 关闭空闲超时、超过最大使用时间的连接
+            conns = pool.borrow_idle()
+            dubbo_logger.debug('dubbo_conn开始心跳：host: %s， idle: %s' % (str(host), len(conns)))
+            for conn in conns:
+                ok = False
                 try:
                     heartbeat_stream(conn)
-                except IOError:
-                    conn = conn_pool.new_conn(host)
+                    ok = True
+                except (IOError, RPCConnError) as e:
+                    dubbo_logger.debug('dubbo_conn心跳失败：host: %s，%s' % (str(host), e))
                 finally:
-                    conn_pool.release_conn(host, conn)
-                    max_conn -= 1
+                    pool.return_borrowed(conn, ok)
+            pool.fill()  # 补足最少的连接数量
+
+        for host, connections in mux_pool.all_conn().items():
+            for conn in connections:
+                if conn.closed():
+                    continue
+                try:
+                    conn.ping(CONN_TIME_OUT)
+                except (IOError, FutureTimeoutError) as e:  # 关闭后在下次使用时重新创建
+                    dubbo_logger.debug('dubbo多路复用连接心跳失败：host: %s，%s' % (host, e))
+                    conn.close(e)
 
 
 def heartbeat_stream(conn):
@@ -44,9 +56,7 @@ def heartbeat_stream(conn):
     """
     conn.write(bytearray(CLI_HEARTBEAT_REQ_HEAD + list(bytearray(pack('!q', get_invoke_id()))) +
                          CLI_HEARTBEAT_TAIL))
-    heartbeat_type, body_length = parse_response_head(conn.read(16))
+    heartbeat_type, body_length = parse_response_head(conn.read_exact(HEAD_LENGTH))
     if heartbeat_type != 1:  # 接收到的数据不是dubbo的心跳响应
         raise RPCConnError('接收dubbo心跳数据错误')
-    body_buffer = []
-    while body_length > len(body_buffer):
-        body_buffer.extend(list(conn.read(DEFAULT_READ_PARAMS)))
+    conn.read_exact(body_length)  # 心跳的响应体没有用处，只需要完整地读出，不影响后续的响应